@@ -1,20 +1,40 @@
-import sounddevice as sd
+import time
+APP_START = time.perf_counter()  # مرجع قياس زمن بدء التشغيل
+import importlib
 import numpy as np
 import queue
+import collections
 import webrtcvad
-import torch
-import whisper
-import keyboard
-from scipy.signal import butter, lfilter
-import time
 import tkinter as tk
 from tkinter import ttk, Label, Button, Frame, StringVar, OptionMenu, messagebox
 import threading
 import screeninfo
 import os
 import json
+import gc
+import dataclasses
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+
+# وحدة ثقيلة تُستورد عند أول استخدام فقط حتى تظهر النافذة بسرعة
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+torch = LazyModule("torch")
+whisper = LazyModule("whisper")
+sd = LazyModule("sounddevice")
+keyboard = LazyModule("keyboard")
+scipy_signal = LazyModule("scipy.signal")
 
-#pyinstaller --onefile --windowed --icon=app_icon.ico --add-data "C:\Users\karim\OneDrive\Desktop\Python\.venv\Lib\site-packages\whisper\assets;whisper\assets" --hidden-import=requests --hidden-import=whisper --hidden-import=torch --hidden-import=numpy main.py
+#pyinstaller --onefile --windowed --icon=app_icon.ico --add-data "C:\Users\karim\OneDrive\Desktop\Python\.venv\Lib\site-packages\whisper\assets;whisper\assets" --hidden-import=requests --hidden-import=whisper --hidden-import=torch --hidden-import=numpy --hidden-import=sounddevice --hidden-import=keyboard --hidden-import=scipy.signal main.py
 # الثوابت العامة
 
 import logging
@@ -47,11 +67,48 @@ MODELS_DIR = os.path.join(CONFIG_DIR, "models")
 SAMPLE_RATE = 16000
 FRAME_DURATION = 30  # مللي ثانية
 FRAME_SIZE = int(SAMPLE_RATE * (FRAME_DURATION / 1000))
-BLOCK_SIZE = 480
+FRAME_HOP = FRAME_SIZE // 2  # تداخل الإطارات لتحسين الدقة
+BLOCK_SIZE = FRAME_HOP  # كتل أصغر لتقليل زمن الاستجابة بعد توحيد VAD على مستوى الكتلة
 CHANNELS = 1
 SILENCE_THRESHOLD = 0.3
 MAX_SEGMENT_DURATION = 3.0
-MAX_QUEUE_SIZE = 10
+MAX_QUEUE_SIZE = 10  # أقصى عدد من المقاطع النهائية المنتظرة
+PARTIAL_DEADLINE = 1.0  # المقطع الجزئي الأقدم من هذا لم يعد مفيداً (ثانية)
+FINAL_DEADLINE = 8.0    # المقطع النهائي الأقدم من هذا يُسقط لتفادي تراكم التأخير (ثانية)
+PARTIAL_MIN_DURATION = 0.45  # أقل مدة كلام قبل إرسال أول مقطع جزئي (ثانية)
+PARTIAL_INTERVAL = 0.15      # الفاصل بين المقاطع الجزئية المتتالية (ثانية)
+MIN_FINAL_DURATION = 0.3     # أقل مدة كلام لإرسال مقطع نهائي (ثانية)
+MIN_TAIL_DURATION = 0.3  # أقصر ذيل غير مثبت يستحق إعادة فك الترميز (ثانية)
+STREAM_PROMPT_CHARS = 200  # أقصى طول للنص المثبت المستخدم كسياق
+# سياسات فك الترميز لكل نوع مقطع (max_tokens=0 يعني حد Whisper الافتراضي،
+# tokens_per_second=0 يعني بلا حد متناسب مع طول الصوت)
+DEFAULT_DECODE_POLICIES = {
+    "partial": {"beam_size": 1, "best_of": 1, "max_tokens": 0, "tokens_per_second": 8, "use_prompt": True},
+    "final": {"beam_size": 3, "best_of": 1, "max_tokens": 0, "tokens_per_second": 12, "use_prompt": True}
+}
+MIN_TOKEN_CAP = 8  # أدنى حد للرموز حتى لا تُقطع المقاطع القصيرة جداً
+PROMPT_CACHE_SIZE = 16  # عدد نصوص السياق المحفوظة بعد تحويلها لرموز
+DRAFT_TOKENS = 4  # عدد الرموز التي يقترحها نموذج المسودة في كل خطوة تحقق
+REPETITION_MAX_NGRAM = 8   # أطول عبارة (بالرموز) يُبحث عن تكرارها في نهاية النص
+# التكرار القصير كلام طبيعي ("no, no, no" أو "go, go, go, go")، فالحراسة للحلقات الطويلة فقط
+REPETITION_MIN_COPIES = 4  # أقل عدد نسخ متتالية للعبارة حتى تُعد هلوسة
+REPETITION_MIN_SPAN = 12   # أقل طول للجزء المكرر (رمز واحد يحتاج 12 نسخة وعبارة من رمزين 6 نسخ)
+NO_SPEECH_SKIP = 0.9  # احتمال عدم وجود كلام الذي يُتجاوز عنده فك الترميز كلياً
+REFINE_HISTORY = 8  # عدد المقاطع النهائية الأخيرة المحفوظة لإعادة فك ترميزها
+REFINE_IDLE_DELAY = 0.5  # أقل مدة صمت قبل بدء التحسين في الخلفية (ثانية)
+# سعة مخزن الكلام: ضعف المدة القصوى لأن المقطع لا يُغلق إلا عند أول إطار صامت
+SPEECH_BUFFER_CAPACITY = int(SAMPLE_RATE * MAX_SEGMENT_DURATION * 2)
+CAPTURE_BUFFER_CAPACITY = SAMPLE_RATE * 2  # مخزن الالتقاط بين callback وخيط التقطيع (ثانيتان)
+HIGHPASS_CUTOFF = 100  # تردد القطع لفلتر إزالة الضوضاء المنخفضة (هرتز)
+PEAK_RELEASE_TIME = 2.0  # زمن تلاشي القمة الجارية للتحكم بالكسب (ثانية)
+PEAK_FLOOR = 0.02  # أدنى قمة مسموحة حتى لا يُضخَّم الضجيج الخافت
+RTF_STEP_DOWN = 0.8   # نسبة زمن المعالجة إلى مدة الصوت التي يُخفض عندها مستوى الجودة
+RTF_STEP_UP = 0.4     # النسبة التي يُرفع عندها المستوى مجدداً (فجوة التخلف تمنع التذبذب)
+MAX_QUEUE_LAG = 1.0   # أقصى انتظار للمقطع في القائمة قبل اعتبار النظام متأخراً (ثانية)
+QUALITY_HOLD_TIME = 5.0  # أقل مدة بين تغييرين لمستوى الجودة (ثانية)
+
+# ساعة خط المعالجة للطوابع والمواعيد النهائية (تُستبدل بساعة افتراضية في إعادة التشغيل)
+clock = time.time
 
 settings_window_open = False
 settings_window = None
@@ -89,10 +146,11 @@ THEME = {
 }
 
 # الخيارات المتاحة للمودل
+# speed: السرعة النسبية التقريبية لكل نموذج (من جدول نماذج Whisper، large = 1)
 AVAILABLE_MODELS = {
-    "tiny": {"size": "~75MB", "description": "متوسط - سريع مع دقة مقبولة", "arabic_name": "متوسط"},
-    "base": {"size": "~150MB", "description": "دقيق - متوازن بين السرعة والدقة", "arabic_name": "دقيق"},
-    "small": {"size": "~500MB", "description": "دقيق جدا - بطيء مع دقة عالية", "arabic_name": "دقيق جدا"}
+    "tiny": {"size": "~75MB", "description": "متوسط - سريع مع دقة مقبولة", "arabic_name": "متوسط", "speed": 10},
+    "base": {"size": "~150MB", "description": "دقيق - متوازن بين السرعة والدقة", "arabic_name": "دقيق", "speed": 7},
+    "small": {"size": "~500MB", "description": "دقيق جدا - بطيء مع دقة عالية", "arabic_name": "دقيق جدا", "speed": 4}
 }
 
 # اللغات المدعومة
@@ -109,21 +167,474 @@ SUPPORTED_LANGUAGES = {
 }
 
 
+# مخزن حلقي مسبق الحجز للعينات الصوتية (بدون حجز ذاكرة جديد لكل إطار)
+class AudioRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._start = 0  # إجمالي العينات المقروءة
+        self._end = 0    # إجمالي العينات المكتوبة
+    
+    def __len__(self):
+        return self._end - self._start
+    
+    def free(self):
+        return self.capacity - len(self)
+    
+    def write(self, samples):
+        """كتابة العينات وإرجاع عدد ما كُتب فعلاً (يُهمل ما يتجاوز السعة)"""
+        count = min(len(samples), self.free())
+        position = self._end % self.capacity
+        first = min(count, self.capacity - position)
+        self._data[position:position + first] = samples[:first]
+        self._data[:count - first] = samples[first:count]
+        self._end += count
+        return count
+    
+    def view(self):
+        """عرض بدون نسخ إذا كانت البيانات متصلة، وإلا نسخة واحدة متصلة"""
+        position = self._start % self.capacity
+        count = len(self)
+        if position + count <= self.capacity:
+            return self._data[position:position + count]
+        return np.concatenate((self._data[position:], self._data[:position + count - self.capacity]))
+    
+    def copy(self):
+        """نسخة واحدة متصلة يمكن تسليمها لخيط آخر بأمان"""
+        data = self.view()
+        return data.copy() if data.base is self._data else data
+    
+    def read(self, count):
+        """قراءة حتى count عينة وإزالتها من المخزن (آمنة لكاتب واحد وقارئ واحد)"""
+        count = min(count, len(self))
+        position = self._start % self.capacity
+        first = min(count, self.capacity - position)
+        if first == count:
+            samples = self._data[position:position + count].copy()
+        else:
+            samples = np.concatenate((self._data[position:], self._data[:count - first]))
+        self._start += count
+        return samples
+    
+    def clear(self):
+        """غير آمنة بين خيطين: تُستخدم فقط من الخيط الوحيد الذي يكتب ويقرأ"""
+        self._start = self._end = 0
+
+# جدولة المقاطع: النهائية أولاً، دمج الجزئية لكل عبارة، وإسقاط ما تجاوز موعده
+class SegmentScheduler:
+    def __init__(self, max_finals=MAX_QUEUE_SIZE):
+        self.max_finals = max_finals
+        self._lock = threading.Condition()
+        self._finals = collections.deque()
+        self._partials = {}  # رقم العبارة -> أحدث مقطع جزئي لها (بترتيب الوصول)
+        self.counters = {
+            "enqueued": 0,
+            "coalesced": 0,        # مقاطع جزئية استُبدلت بأحدث منها
+            "dropped_deadline": 0, # مقاطع تجاوزت موعدها قبل معالجتها
+            "dropped_full": 0      # مقاطع نهائية رُفضت لامتلاء القائمة
+        }
+        self.last_wait = 0.0  # مدة انتظار آخر مقطع أُخرج من القائمة (ثانية)
+        self.closed = False
+    
+    def put(self, audio_segment, is_final, segment_utterance, trace=None):
+        """إضافة مقطع؛ تُرجع False إذا رُفض المقطع"""
+        now = clock()
+        trace = {} if trace is None else trace
+        trace["enqueue"] = now
+        with self._lock:
+            if is_final:
+                if len(self._finals) >= self.max_finals:
+                    self.counters["dropped_full"] += 1
+                    return False
+                self._finals.append((now + FINAL_DEADLINE, audio_segment, True, segment_utterance, trace))
+                # الجزء المنتظر لنفس العبارة أصبح قديماً بوصول النهائي
+                if self._partials.pop(segment_utterance, None) is not None:
+                    self.counters["coalesced"] += 1
+            else:
+                if self._partials.pop(segment_utterance, None) is not None:
+                    self.counters["coalesced"] += 1
+                self._partials[segment_utterance] = (now + PARTIAL_DEADLINE, audio_segment, False, segment_utterance, trace)
+            self.counters["enqueued"] += 1
+            self._lock.notify()
+        return True
+    
+    def close(self):
+        """إيقاف الانتظار: get تُرجع None بعد تفريغ ما تبقى"""
+        with self._lock:
+            self.closed = True
+            self._lock.notify_all()
+    
+    def get(self, timeout=None):
+        """انتظار المقطع التالي حسب الأولوية؛ تُرجع None عند انتهاء المهلة أو الإغلاق"""
+        with self._lock:
+            end_time = None if timeout is None else time.time() + timeout
+            while True:
+                item = self._pop_next()
+                if item is not None or self.closed:
+                    return item
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._lock.wait(remaining)
+    
+    def get_batch(self, max_size=1, max_wait=0.0):
+        """المقطع التالي، أو عدة مقاطع نهائية معاً إذا كانت القائمة متراكمة"""
+        first = self.get()
+        if first is None:
+            return []
+        batch = [first]
+        if not first[1] or max_size <= 1:
+            return batch
+        
+        end_time = time.time() + max_wait
+        with self._lock:
+            while len(batch) < max_size:
+                item = self._pop_final()
+                if item is not None:
+                    batch.append(item)
+                    continue
+                # لا انتظار إذا كانت القائمة خاملة: فك ترميز فردي مباشرة
+                remaining = end_time - time.time()
+                if len(batch) == 1 or remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+        return batch
+    
+    def _pop_next(self):
+        item = self._pop_final()
+        return item if item is not None else self._pop_partial()
+    
+    def _pop_final(self):
+        now = clock()
+        while self._finals:
+            deadline, audio_segment, is_final, segment_utterance, trace = self._finals.popleft()
+            if deadline >= now:
+                self.last_wait = now - (deadline - FINAL_DEADLINE)
+                trace["dequeue"] = now
+                return audio_segment, is_final, segment_utterance, trace
+            self.counters["dropped_deadline"] += 1
+        return None
+    
+    def _pop_partial(self):
+        now = clock()
+        while self._partials:
+            segment_utterance = next(iter(self._partials))
+            deadline, audio_segment, is_final, _, trace = self._partials.pop(segment_utterance)
+            if deadline >= now:
+                self.last_wait = now - (deadline - PARTIAL_DEADLINE)
+                trace["dequeue"] = now
+                return audio_segment, is_final, segment_utterance, trace
+            self.counters["dropped_deadline"] += 1
+        return None
+    
+    def qsize(self):
+        with self._lock:
+            return len(self._finals) + len(self._partials)
+    
+    def empty(self):
+        return self.qsize() == 0
+    
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, finals=len(self._finals), partials=len(self._partials))
+
+# مقاييس زمن كل مرحلة لكل مقطع (نوافذ متحركة للمئينات) وعدادات الأحداث
+class Metrics:
+    # المراحل المحسوبة من طوابع المقطع: (الاسم، من، إلى)
+    TRACE_STAGES = (
+        ("vad", "capture", "vad"),
+        ("enqueue", "vad", "enqueue"),
+        ("queue", "enqueue", "dequeue"),
+        ("transcribe", "dequeue", "publish"),
+        ("render", "publish", "render"),
+        ("end_to_end", "capture", "render")
+    )
+    
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._values = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.counters = collections.Counter()
+        self._next_id = 0
+    
+    def new_trace(self, **stamps):
+        """طوابع زمنية جديدة لمقطع برقم تعريف فريد"""
+        with self._lock:
+            self._next_id += 1
+            return dict(stamps, id=self._next_id)
+    
+    def observe(self, name, value):
+        with self._lock:
+            self._values[name].append(value)
+    
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+    
+    def observe_result(self, result):
+        """أزمنة المعالجة المسبقة والترميز وفك الترميز لنتيجة نسخ"""
+        self.observe("preprocess", result["preprocess_time"])
+        self.observe("encode", result["encode_time"] - result["preprocess_time"])
+        self.observe("decode", result["decode_time"])
+        processing = result["encode_time"] + result["decode_time"]
+        self.count("processing_seconds", processing)
+        if result["audio_seconds"] > 0:
+            self.observe("rtf", processing / result["audio_seconds"])
+        for guard in result.get("guards", ()):
+            # عدد مرات عمل كل حراسة (token_cap و repetition و no_speech)
+            self.count(f"guard_{guard}")
+        if result.get("draft_steps"):
+            # إحصاءات قبول اقتراحات نموذج المسودة
+            self.count("draft_proposed", result["draft_proposed"])
+            self.count("draft_accepted", result["draft_accepted"])
+            self.count("draft_steps", result["draft_steps"])
+    
+    def complete(self, trace):
+        """إغلاق طوابع مقطع عند عرضه وتسجيل زمن كل مرحلة"""
+        for name, start, end in self.TRACE_STAGES:
+            if start in trace and end in trace:
+                self.observe(name, trace[end] - trace[start])
+        self.count("rendered")
+    
+    def snapshot(self):
+        with self._lock:
+            values = {name: np.array(v) for name, v in self._values.items() if v}
+            counters = dict(self.counters)
+        
+        stages = {}
+        for name, data in values.items():
+            p50, p95, p99 = np.percentile(data, [50, 95, 99])
+            stages[name] = {"count": len(data), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+        return {"stages": stages, "counters": counters}
+
+# التحكم التكيفي بالجودة حسب نسبة الزمن الحقيقي (RTF) وتأخر القائمة
+class QualityController:
+    # كل مستوى يضيف تخفيضاً فوق المستوى الذي قبله
+    LEVELS = ("full", "greedy", "fewer_partials", "smaller_model")
+    
+    def __init__(self):
+        self.level = 0
+        self.rtf = 0.0  # متوسط متحرك لزمن المعالجة / مدة الصوت
+        self.lag = 0.0  # متوسط متحرك لانتظار المقاطع في القائمة
+        self._changed_at = clock()
+        self._lock = threading.Lock()
+        self._smaller = None      # النموذج الأصغر المستخدم في المستوى الأخير
+        self._switching = False   # تبديل نموذج جارٍ: لا يتغير المستوى حتى ينتهي
+        self._partial_min_duration = PARTIAL_MIN_DURATION
+        self._partial_interval = PARTIAL_INTERVAL
+    
+    def observe(self, audio_seconds, processing_seconds, wait_seconds):
+        """تسجيل قياس مقطع معالج وتغيير المستوى عند الحاجة"""
+        if audio_seconds <= 0 or not config.get("adaptive_quality", True):
+            return
+        
+        with self._lock:
+            self.rtf = 0.8 * self.rtf + 0.2 * (processing_seconds / audio_seconds)
+            self.lag = 0.8 * self.lag + 0.2 * wait_seconds
+            
+            # الانتظار بعد كل تغيير حتى تعكس القياسات أثره
+            if self._switching or clock() - self._changed_at < QUALITY_HOLD_TIME:
+                return
+            
+            behind = self.rtf > RTF_STEP_DOWN or self.lag > MAX_QUEUE_LAG
+            ahead = self.step_up_rtf() < RTF_STEP_UP and self.lag < MAX_QUEUE_LAG / 4
+            if behind and self.level < self.max_level():
+                self._set_level(self.level + 1)
+            elif ahead and self.level > 0:
+                self._set_level(self.level - 1)
+    
+    def step_up_rtf(self):
+        """RTF المتوقع بعد رفع المستوى"""
+        # النموذج الأصغر يقيس سرعته هو: يُقدَّر RTF النموذج الكامل بنسبة سرعتيهما وإلا تذبذب المستوى بينهما
+        if self.level == 3 and self._smaller:
+            return self.rtf * AVAILABLE_MODELS[self._smaller]["speed"] / AVAILABLE_MODELS[config["model_size"]]["speed"]
+        return self.rtf
+    
+    def max_level(self):
+        # لا يوجد نموذج أصغر من الأصغر
+        return len(self.LEVELS) - 1 if smaller_model_name() else len(self.LEVELS) - 2
+    
+    def decode_options(self, transcribe_options):
+        """خيارات فك الترميز للمقطع حسب المستوى الحالي"""
+        # المقاطع الجزئية جشعة أصلاً، فأكبر توفير في شعاع المقاطع النهائية
+        if self.level < 1:
+            return transcribe_options
+        return dict(transcribe_options, beam_size=1)
+    
+    def _set_level(self, level):
+        # النموذج الأصغر مؤقت (لا يُحفظ في الإعدادات) ولا يتغير المستوى إلا بعد نجاح التبديل
+        if (level == 3) != (self.level == 3):
+            model_name = smaller_model_name() if level == 3 else config["model_size"]
+            self._switching = True
+            switch_model(model_name, persist=False,
+                         on_done=lambda ok: self._model_switched(level, model_name, ok))
+            return
+        self._apply_level(level)
+    
+    def _model_switched(self, level, model_name, ok):
+        with self._lock:
+            self._switching = False
+            self._changed_at = clock()
+            if ok:
+                self._smaller = model_name if level == 3 else None
+                self._apply_level(level)
+    
+    def _apply_level(self, level):
+        global PARTIAL_MIN_DURATION, PARTIAL_INTERVAL
+        self.level = level
+        self._changed_at = clock()
+        print(f"⚙ مستوى الجودة: {self.LEVELS[level]} (RTF {self.rtf:.2f}، تأخر {self.lag:.2f}s)")
+        
+        # مقاطع جزئية أقل: بداية أبطأ وفاصل أطول
+        if level >= 2:
+            PARTIAL_MIN_DURATION = self._partial_min_duration * 2
+            PARTIAL_INTERVAL = self._partial_interval * 4
+        else:
+            PARTIAL_MIN_DURATION = self._partial_min_duration
+            PARTIAL_INTERVAL = self._partial_interval
+
+# سجل النماذج المحملة في العملية: كل نموذج يُحمّل مرة واحدة ويُشارك بعدّاد مراجع
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}     # (الاسم، الدقة، الجهاز) -> [النموذج، عدد المستخدمين]
+        self._key_locks = {}  # قفل لكل مفتاح حتى لا يُحمّل النموذج نفسه مرتين بالتوازي
+    
+    @staticmethod
+    def key(model_name, precision=None):
+        precision = precision or config.get("precision", "fp32")
+        backend = get_device()
+        # التكميم الديناميكي يعمل على المعالج فقط، وإلا يُحمّل fp32
+        if precision == "int8" and backend != "cpu":
+            precision = "fp32"
+        return (model_name, precision, backend)
+    
+    def acquire(self, model_name, precision=None):
+        """إرجاع النموذج المشترك (مع تحميله إن لزم) وزيادة عدد مستخدميه"""
+        key = self.key(model_name, precision)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        
+        with key_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    entry[1] += 1
+                    return entry[0]
+            
+            model = load_whisper_model(model_name, key[1])
+            with self._lock:
+                self._models[key] = [model, 1]
+            return model
+    
+    def release(self, model):
+        """إنقاص عدد مستخدمي النموذج؛ تُرجع True إذا أُزيل من السجل"""
+        with self._lock:
+            for key, entry in self._models.items():
+                if entry[0] is model:
+                    entry[1] -= 1
+                    if entry[1] > 0:
+                        return False
+                    del self._models[key]
+                    print(f"🗑 تم تحرير النموذج {key[0]} ({key[1]}, {key[2]})")
+                    return True
+        return False
+    
+    def loaded(self):
+        with self._lock:
+            return {key: entry[1] for key, entry in self._models.items()}
+
+# النص المحفوظ للجلسة: سطر لكل مقطع نهائي، ويُعاد كتابة الملف عند تحسين سطر سابق
+class Transcript:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._lines = {}  # رقم المقطع -> النص (بترتيب الظهور)
+        
+        # نص الجلسات السابقة في نفس الملف يبقى كما هو قبل سطور هذه الجلسة
+        self._previous = ""
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._previous = f.read()
+            if self._previous and not self._previous.endswith("\n"):
+                self._previous += "\n"
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n")
+    
+    def add(self, segment_id, text):
+        with self._lock:
+            self._lines[segment_id] = text
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(text + "\n")
+    
+    def revise(self, segment_id, text):
+        """استبدال نص مقطع سابق؛ تُرجع False إذا لم يكن في النص المحفوظ"""
+        with self._lock:
+            if segment_id not in self._lines:
+                return False
+            self._lines[segment_id] = text
+            # الكتابة في ملف مؤقت ثم الاستبدال حتى لا يبقى الملف نصف مكتوب
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self._previous)
+                f.writelines(line + "\n" for line in self._lines.values())
+            os.replace(temp_path, self.path)
+            return True
+
 # تهيئة المتغيرات العامة
-audio_queue = queue.Queue()
-processing_queue = queue.Queue()
+processing_queue = SegmentScheduler()
 subtitle_queue = queue.Queue()
-audio_buffer = []
+ui_root = None  # نافذة الترجمة التي تُوقَظ عند وصول بيانات جديدة
+ui_title_label = None  # عنوان النافذة مع اللغة (يُحدَّث عند تغيير اللغة من الإعدادات)
+ui_wake_pending = threading.Event()  # يمنع تكرار حدث الإيقاظ قبل تفريغ القائمة
+capture_buffer = AudioRingBuffer(CAPTURE_BUFFER_CAPACITY)  # callback يكتب، خيط التقطيع يقرأ
+capture_event = threading.Event()  # إيقاظ خيط التقطيع عند وصول عينات جديدة
+pipeline_stop = threading.Event()  # إيقاف خيط التقطيع (إعادة التشغيل دون اتصال)
+refine_wakeup = threading.Event()  # إيقاظ خيط التحسين عند إضافة مقطع نهائي أو الإيقاف
+capture_dropped = 0  # عدد العينات المفقودة لامتلاء مخزن الالتقاط
+last_capture_time = 0.0  # وقت وصول آخر كتلة من callback
+block_captured_at = 0.0  # وقت التقاط الكتلة التي يعالجها خيط التقطيع حالياً
+speech_buffer = AudioRingBuffer(SPEECH_BUFFER_CAPACITY)
+speech_written_until = 0  # موضع آخر عينة أضيفت لمخزن الكلام داخل التدفق
+next_partial_at = 0  # طول المقطع (بالعينات) الذي يُرسل عنده الجزء التالي
+stream_position = 0  # موضع بداية الكتلة الحالية داخل التدفق (بالعينات)
+highpass_sos = None  # معاملات الفلتر كأقسام من الدرجة الثانية (تُحسب مرة واحدة)
+highpass_state = None  # حالة الفلتر (zi) المحفوظة بين الكتل
+running_peak = PEAK_FLOOR  # القمة الجارية للتحكم بالكسب
 silence_counter = 0
 is_speaking = False
-last_speech_time = time.time()
-last_segment_time = time.time()
+last_speech_time = clock()
+last_segment_time = clock()
 previous_text = ""
 context_buffer = []
+context_lock = threading.Lock()  # يحمي context_buffer بين النشر والتحسين (يُعدل في مكانه ولا يُعاد ربطه)
+utterance_id = 0  # رقم العبارة الحالية لربط المقاطع الجزئية بالنهائية
+# حالة فك الترميز المتدفق للعبارة الجارية
+stream_state = {
+    "utterance_id": None,
+    "committed": [],        # الكلمات المثبتة (نص فقط)
+    "committed_until": 0,   # موضع نهاية النص المثبت داخل العبارة (بالعينات)
+    "hypothesis": []        # كلمات الفرضية السابقة غير المثبتة: (نص، بداية، نهاية)
+}
 config = {}
 MODEL = None
+DRAFT_MODEL = None  # نموذج المسودة لفك الترميز التخميني (None = معطل)
+model_registry = ModelRegistry()  # النماذج المحملة مشتركة بين التنزيل والنسخ
+quality_controller = QualityController()
+metrics = Metrics()
+pool = None  # مجمع عمليات النسخ عند تفعيل worker_processes
+pool_tickets = queue.Queue()  # المقاطع المرسلة للمجمع بترتيب إرسالها
+stream_lock = threading.Lock()  # يحمي stream_state بين خيط التوزيع وخيط النشر
 current_theme = "dark"  # الوضع الافتراضي
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DEVICE = None  # يُحدد عند أول استخدام عبر get_device() لتأجيل استيراد torch
+model_ready = threading.Event()  # يُضبط بعد تحميل النموذج وتسخينه
+model_error = None  # رسالة خطأ تحميل النموذج في الخلفية إن وجد
+model_switch_lock = threading.Lock()  # تبديل نموذج واحد في كل مرة
+prompt_token_cache = collections.OrderedDict()  # نص السياق -> رموزه (الأحدث استخداماً في النهاية)
+prompt_cache_lock = threading.Lock()
+decode_lock = threading.Lock()  # خطافات ذاكرة المفكك على وحدات النموذج نفسها: فك ترميز واحد في كل مرة
+refine_segments = collections.deque(maxlen=REFINE_HISTORY)  # (رقم المقطع، الصوت، النص، الترجمة)
+transcript = None  # النص المحفوظ عند تحديد transcript_file
+displayed_segment = None  # رقم المقطع النهائي المعروض حالياً في الواجهة
 vad = None  # سيتم تعريفه لاحقاً في start_transcription
 
 # إنشاء مجلد الإعدادات إذا لم يكن موجوداً
@@ -140,7 +651,28 @@ def load_config():
         "opacity": 0.85,
         "font_size": 18,
         "last_device_id": None,
-        "models_downloaded": []
+        "models_downloaded": [],
+        "variable_length_encoder": True,  # ترميز الطول الفعلي للمقطع بدلاً من نافذة 30 ثانية
+        "encoder_min_seconds": 3.0,       # الحد الأدنى لطول مدخل المُرمِّز
+        "batch_max_size": 4,              # أقصى عدد مقاطع نهائية تُفك معاً عند تراكم القائمة
+        "batch_max_wait": 0.1,            # أقصى انتظار لاكتمال الدفعة بعد تراكمها (ثانية)
+        "metrics_port": 0,                # منفذ خادم المقاييس المحلي عند الحاجة، مثل 8765 (0 = معطل)
+        "metrics_interval": 30,           # الفاصل بين ملخصات المقاييس في السجل (ثانية، 0 = معطل)
+        "dual_output": False,             # سطر بلغة المصدر وسطر مترجم للإنجليزية من ترميز واحد
+        "draft_model": "",                # نموذج مسودة لفك الترميز التخميني (مثل "tiny"، فارغ = معطل)
+        "draft_tokens": DRAFT_TOKENS,     # الرموز المقترحة في كل خطوة تحقق
+        "repetition_guard": True,         # إيقاف فك الترميز عند تكرار عبارة في نهايته وقص النسخ الزائدة
+        "no_speech_skip": NO_SPEECH_SKIP, # تجاوز المفكك إذا كان احتمال عدم الكلام أعلى من هذا (0 = معطل)
+        "refinement": False,              # إعادة فك ترميز المقاطع النهائية الأخيرة في أوقات الصمت
+        "refine_model": "",               # نموذج التحسين (فارغ = النموذج الحالي)
+        "refine_beam_size": 5,            # حجم الشعاع عند التحسين
+        "transcript_file": "",            # ملف حفظ النص النهائي (فارغ = بدون حفظ)
+        "decode_policies": DEFAULT_DECODE_POLICIES,  # يمكن تعديل أي مفتاح لكل من partial و final
+        "adaptive_quality": True,         # خفض الجودة تلقائياً عند التأخر ورفعها عند توفر الوقت
+        "precision": "fp32",              # "int8" لتكميم طبقات Linear ديناميكياً على المعالج
+        "mmap_checkpoints": True,         # تحميل الأوزان بربط الملف بالذاكرة (مشاركة الصفحات بين العمليات)
+        "worker_processes": 0,            # عدد عمليات النسخ المستقلة (0 = النسخ داخل العملية الرئيسية)
+        "worker_torch_threads": 0         # خيوط torch لكل عملية (0 = توزيع أنوية المعالج بالتساوي)
     }
     
     try:
@@ -261,9 +793,9 @@ def download_model(model_name, progress_var, status_label):
         progress_thread.start()
         
         try:
-            # تحميل النموذج باستخدام مكتبة whisper
-            print(f"بدء تحميل النموذج {model_name} باستخدام whisper.load_model")
-            model = whisper.load_model(model_name, download_root=MODELS_DIR)
+            # تنزيل ملف النموذج فقط (مع التحقق من SHA256)؛ التحميل في الذاكرة يتم عبر سجل النماذج
+            print(f"بدء تحميل النموذج {model_name}")
+            whisper._download(whisper._MODELS[model_name], MODELS_DIR, False)
             
             # إيقاف خيط التحديث
             progress_thread_running = False
@@ -325,26 +857,845 @@ def download_model(model_name, progress_var, status_label):
         status_label.config(text=f"خطأ في التحميل: {str(e)}")
         return False
 
-# معالجة الصوت وإزالة الضوضاء
+# معالجة الصوت وإزالة الضوضاء: تُطبَّق مرة واحدة على كل عينة عند التقاطها
 def process_audio(audio_data):
-    # تطبيع مستوى الصوت
-    max_val = np.max(np.abs(audio_data))
-    if max_val > 0:
-        normalized = audio_data / max_val * 0.9
-    else:
-        normalized = audio_data
+    global highpass_sos, highpass_state, running_peak
+    
+    # تطبيق فلتر لإزالة الضوضاء المنخفضة التردد مع الحفاظ على حالته بين الكتل
+    if highpass_sos is None:
+        highpass_sos = butter_highpass(cutoff=HIGHPASS_CUTOFF, fs=SAMPLE_RATE, order=2)
+        highpass_state = np.zeros((highpass_sos.shape[0], 2))
+    filtered, highpass_state = scipy_signal.sosfilt(highpass_sos, audio_data, zi=highpass_state)
     
-    # تطبيق فلتر لإزالة الضوضاء المنخفضة التردد
-    b, a = butter_highpass(cutoff=100, fs=SAMPLE_RATE, order=2)
-    filtered = lfilter(b, a, normalized)
+    # تحديث القمة الجارية (تتلاشى تدريجياً) بدلاً من التطبيع بأقصى قيمة لكل مقطع
+    if len(filtered):
+        decay = np.exp(-len(filtered) / (PEAK_RELEASE_TIME * SAMPLE_RATE))
+        running_peak = max(float(np.max(np.abs(filtered))), running_peak * decay, PEAK_FLOOR)
     
     return filtered.astype(np.float32)
 
+# كسب تطبيع مستوى الصوت المحسوب من القمة الجارية
+def current_gain():
+    return 0.9 / running_peak
+
 def butter_highpass(cutoff=100, fs=SAMPLE_RATE, order=2):
     nyq = 0.5 * fs
     normal_cutoff = cutoff / nyq
-    b, a = butter(order, normal_cutoff, btype="high", analog=False)
-    return b, a
+    return scipy_signal.butter(order, normal_cutoff, btype="high", analog=False, output="sos")
+
+# ----- تحميل النماذج والتكميم -----
+
+# مسار نسخة النموذج المكممة المحفوظة على القرص
+def quantized_model_path(model_name):
+    return os.path.join(MODELS_DIR, f"{model_name}-int8.pt")
+
+# استبدال طبقات Linear الخاصة بـ Whisper بطبقات nn.Linear عادية يتعرف عليها التكميم
+def use_plain_linear_layers(module):
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+            plain = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+            plain.weight = child.weight
+            plain.bias = child.bias
+            setattr(module, name, plain)
+        else:
+            use_plain_linear_layers(child)
+
+# حفظ ملف torch بكتابته في ملف مؤقت خاص بالعملية ثم استبداله دفعة واحدة:
+# عمليات المجمع قد تحفظ الملف نفسه معاً، ولا يرى أي منها ملفاً نصف مكتوب
+def save_atomically(obj, path):
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(obj, temp)
+        os.replace(temp, path)
+    except OSError:
+        # على Windows يفشل الاستبدال إذا كانت عملية أخرى قد سبقت وفتحت الملف: نسختها مطابقة
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+# قفل بين العمليات عبر ملف: عمليات المجمع تبدأ معاً ويكفي أن تحوّل إحداها النموذج
+@contextlib.contextmanager
+def file_lock(path, stale_after=600):
+    lock_path = path + ".lock"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # قفل متروك من عملية انتهت أثناء التحويل
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.2)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+# قراءة النسخة المكممة المحفوظة (None إذا لم توجد أو تعذر تحميلها)
+def load_quantized_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        model = torch.load(cache_path, map_location="cpu", weights_only=False)
+        print(f"✅ تم تحميل النموذج المكمم من: {cache_path}")
+        return model
+    except Exception as e:
+        # نسخة محفوظة بإصدار torch مختلف مثلاً: إعادة التكميم
+        print(f"⚠ تعذر تحميل النموذج المكمم، سيعاد التكميم: {e}")
+        return None
+
+# تحميل نموذج بتكميم int8 ديناميكي لطبقات Linear في المُرمِّز والمفكك (مع ذاكرة تخزين على القرص)
+def load_quantized_model(model_name):
+    cache_path = quantized_model_path(model_name)
+    model = load_quantized_cache(cache_path)
+    if model is not None:
+        return model
+    
+    with file_lock(cache_path):
+        # قد تكون عملية أخرى حفظته أثناء انتظار القفل
+        model = load_quantized_cache(cache_path)
+        if model is not None:
+            return model
+        
+        model = whisper.load_model(model_name, device="cpu", download_root=MODELS_DIR)
+        use_plain_linear_layers(model)
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        
+        try:
+            save_atomically(model, cache_path)
+            print(f"✅ تم حفظ النموذج المكمم في: {cache_path}")
+        except Exception as e:
+            print(f"⚠ تعذر حفظ النموذج المكمم: {e}")
+    
+    return model
+
+# مسار نسخة النموذج القابلة للربط بالذاكرة (mmap)
+def mmap_model_path(model_name):
+    return os.path.join(MODELS_DIR, f"{model_name}.mmap.pt")
+
+# تحويل ملف النموذج الأصلي لمرة واحدة إلى صيغة zip قابلة للربط بالذاكرة بأوزان fp32
+def convert_checkpoint_to_mmap(model_name):
+    checkpoint_file = whisper._download(whisper._MODELS[model_name], MODELS_DIR, False)
+    checkpoint = torch.load(checkpoint_file, map_location="cpu", weights_only=True)
+    
+    # الأوزان الأصلية fp16 ويحولها load_model إلى fp32؛ نخزنها بالصيغة النهائية حتى لا تُنسخ عند التحميل
+    state = {
+        name: tensor.float() if tensor.is_floating_point() else tensor
+        for name, tensor in checkpoint["model_state_dict"].items()
+    }
+    
+    target = mmap_model_path(model_name)
+    save_atomically({"dims": checkpoint["dims"], "model_state_dict": state}, target)
+    print(f"✅ تم تحويل النموذج {model_name} إلى صيغة mmap: {target}")
+    return target
+
+# تحميل النموذج بربط الأوزان من الملف مباشرة بدلاً من قراءته ونسخه
+def load_mmap_model(model_name, device):
+    path = mmap_model_path(model_name)
+    converted = False
+    if not os.path.exists(path):
+        with file_lock(path):
+            # قد تكون عملية أخرى حوّلته أثناء انتظار القفل
+            if not os.path.exists(path):
+                path = convert_checkpoint_to_mmap(model_name)
+                converted = True
+    
+    try:
+        model = build_mmap_model(model_name, path)
+    except Exception:
+        # نسخة لا يمكن استخدامها (إصدار torch لا يدعمها): لا نترك نسخة fp32 إضافية على القرص
+        if converted:
+            os.remove(path)
+        raise
+    return model.to(device)
+
+# بناء Whisper بأوزان مربوطة بالملف: الوحدات تُبنى على جهاز meta دون حجز ذاكرة ثم تُسند الأوزان
+def build_mmap_model(model_name, path):
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    dims = whisper.model.ModelDimensions(**checkpoint["dims"])
+    
+    # Whisper.__init__ يستدعي to_sparse الذي لا يعمل على meta، فيُبنى المُرمِّز والمفكك فقط
+    model = whisper.model.Whisper.__new__(whisper.model.Whisper)
+    torch.nn.Module.__init__(model)
+    model.dims = dims
+    with torch.device("meta"):
+        model.encoder = whisper.model.AudioEncoder(
+            dims.n_mels, dims.n_audio_ctx, dims.n_audio_state, dims.n_audio_head, dims.n_audio_layer
+        )
+        model.decoder = whisper.model.TextDecoder(
+            dims.n_vocab, dims.n_text_ctx, dims.n_text_state, dims.n_text_head, dims.n_text_layer
+        )
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    
+    # المخازن غير المحفوظة في الملف بقيت على جهاز meta: إعادة إنشائها
+    n_ctx = dims.n_text_ctx
+    mask = torch.empty(n_ctx, n_ctx).fill_(-np.inf).triu_(1)
+    model.decoder.register_buffer("mask", mask, persistent=False)
+    model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_name])
+    
+    remaining = [name for name, tensor in [*model.named_parameters(), *model.named_buffers()] if tensor.is_meta]
+    if remaining:
+        raise RuntimeError(f"أوزان لم تُحمّل من الملف: {', '.join(remaining[:5])}")
+    return model
+
+# تحديد جهاز الاستدلال (يستورد torch عند أول استدعاء)
+def get_device():
+    global DEVICE
+    if DEVICE is None:
+        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    return DEVICE
+
+# تحميل نموذج Whisper بالدقة المطلوبة
+def load_whisper_model(model_name, precision=None):
+    precision = precision or config.get("precision", "fp32")
+    
+    # التكميم الديناميكي مدعوم على المعالج فقط
+    if precision == "int8" and get_device() == "cpu":
+        model = load_quantized_model(model_name)
+    elif config.get("mmap_checkpoints", True):
+        try:
+            model = load_mmap_model(model_name, get_device())
+        except Exception as e:
+            # إصدار torch قديم (بدون mmap أو meta) أو ملف تالف: التحميل العادي
+            print(f"⚠ تعذر تحميل النموذج بصيغة mmap، سيتم التحميل العادي: {e}")
+            model = whisper.load_model(model_name, device=get_device(), download_root=MODELS_DIR)
+    else:
+        model = whisper.load_model(model_name, device=get_device(), download_root=MODELS_DIR)
+    
+    install_variable_length_encoder()
+    return model
+
+# جعل نموذج من السجل هو النموذج الحالي وتحرير المرجع السابق
+def use_model(model):
+    global MODEL
+    previous, MODEL = MODEL, model
+    if previous is not None and model_registry.release(previous):
+        # آخر مرجع للنموذج السابق: إعادة ذاكرته فوراً
+        del previous
+        gc.collect()
+        if get_device() == "cuda":
+            torch.cuda.empty_cache()
+
+# تحميل نموذج المسودة من الإعدادات وتسخينه؛ None إذا كان معطلاً أو غير متوافق مع النموذج الهدف
+def load_draft_model(target, load=None):
+    name = config.get("draft_model", "")
+    if not name:
+        return None
+    if name not in AVAILABLE_MODELS:
+        print(f"⚠ نموذج المسودة غير معروف: {name}")
+        return None
+    
+    load = load or model_registry.acquire
+    try:
+        draft = load(name)
+    except Exception as e:
+        # المسودة اختيارية: النسخ يستمر بالمسار العادي
+        print(f"⚠ تعذر تحميل نموذج المسودة {name}: {e}")
+        return None
+    if draft is not target and not draft_compatible(target, draft):
+        print(f"⚠ نموذج المسودة {name} لا يشارك النموذج الحالي مفرداته، تم تعطيل فك الترميز التخميني")
+        if load is model_registry.acquire:
+            model_registry.release(draft)
+        return None
+    
+    if draft is target:
+        # يُستخدم تلقائياً إذا بُدّل النموذج الحالي إلى نموذج أكبر
+        print(f"ℹ نموذج المسودة {name} هو النموذج الحالي، فك الترميز التخميني غير مستخدم")
+        return draft
+    
+    warm_up_model(draft)
+    print(f"✅ فك الترميز التخميني مفعل بنموذج المسودة {name}")
+    return draft
+
+# تسخين النموذج بمقطع صامت حتى لا يدفع أول مقطع حقيقي ثمن تهيئة torch
+def warm_up_model(model):
+    # النموذج من السجل قد يكون مستخدماً في خيط آخر (التحسين أو المسودة أو النموذج العائد بعد خفض الجودة)
+    with decode_lock:
+        transcribe_segment(model, np.zeros(SAMPLE_RATE, dtype=np.float32), build_transcribe_options(), word_timestamps=True)
+
+# ----- مسار الاستدلال بطول متغير -----
+
+# السماح لمُرمِّز Whisper بمدخلات أقصر من نافذة الـ30 ثانية
+def install_variable_length_encoder():
+    encoder_class = whisper.model.AudioEncoder
+    if getattr(encoder_class, "_variable_length", False):
+        return
+    
+    def forward(self, x):
+        x = torch.nn.functional.gelu(self.conv1(x))
+        x = torch.nn.functional.gelu(self.conv2(x))
+        x = x.permute(0, 2, 1)
+        
+        # قص الترميز الموضعي على طول المدخل الفعلي
+        assert x.shape[1] <= self.positional_embedding.shape[0], "incorrect audio shape"
+        x = (x + self.positional_embedding[:x.shape[1]]).to(x.dtype)
+        
+        for block in self.blocks:
+            x = block(x)
+        
+        return self.ln_post(x)
+    
+    encoder_class.forward = forward
+    encoder_class._variable_length = True
+
+# الحد الأدنى لطول مدخل المُرمِّز بالثواني (30 = المسار المبطن الأصلي)
+def encoder_min_seconds():
+    if not config.get("variable_length_encoder", True):
+        return whisper.audio.CHUNK_LENGTH
+    return float(config.get("encoder_min_seconds", 3.0))
+
+# حساب الطيف الصوتي بطول المقطع الفعلي بدلاً من تبطينه إلى 30 ثانية
+def prepare_mel(model, audio, min_seconds=None, target_frames=None):
+    if min_seconds is None:
+        min_seconds = encoder_min_seconds()
+    if target_frames is None:
+        target_frames = mel_target_frames(len(audio), min_seconds)
+    
+    hop = whisper.audio.HOP_LENGTH
+    n_frames = min(len(audio) // hop, whisper.audio.N_FRAMES)
+    
+    # التبطين بصمت قبل حساب الطيف كما يفعل transcribe
+    padding = max(0, target_frames * hop - len(audio))
+    mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels, padding=padding)
+    return mel[:, :target_frames], n_frames
+
+# عدد إطارات الطيف المطلوبة لمقطع بطول معين
+def mel_target_frames(n_samples, min_seconds):
+    hop = whisper.audio.HOP_LENGTH
+    target = max(int(min_seconds * SAMPLE_RATE / hop), n_samples // hop)
+    return min(target + target % 2, whisper.audio.N_FRAMES)  # الالتفاف الثاني بخطوة 2
+
+# تحويل خيارات النسخ إلى خيارات فك الترميز
+def build_decoding_options(options, **overrides):
+    fields = whisper.DecodingOptions.__dataclass_fields__
+    kwargs = {k: v for k, v in options.items() if k in fields}
+    kwargs.update(overrides)
+    
+    # best_of غير متوافق مع فك الترميز الجشع، وشعاع بحجم 1 هو نفسه الجشع
+    if kwargs.get("temperature", 0.0) == 0.0:
+        kwargs.pop("best_of", None)
+    if kwargs.get("beam_size") in (None, 1):
+        kwargs.pop("beam_size", None)
+    
+    kwargs.setdefault("without_timestamps", True)
+    return whisper.DecodingOptions(**kwargs)
+
+# محول الرموز الخاص بالنموذج (للترميز والرموز الخاصة فقط، دون لغة أو مهمة)
+def model_tokenizer(model):
+    return whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages)
+
+# رموز نص السياق: السياق لا يتغير إلا عند إضافة جملة أو تثبيت كلمات،
+# فلا داعي لإعادة تحويله لرموز مع كل مقطع جزئي
+def prompt_tokens(model, prompt):
+    with prompt_cache_lock:
+        tokens = prompt_token_cache.get(prompt)
+        if tokens is not None:
+            prompt_token_cache.move_to_end(prompt)
+            metrics.count("prompt_cache_hits")
+            return tokens
+    
+    # نفس تحويل Whisper للسياق النصي (الترميز لا يعتمد على اللغة أو المهمة)
+    tokens = model_tokenizer(model).encode(" " + prompt.strip())
+    with prompt_cache_lock:
+        prompt_token_cache[prompt] = tokens
+        while len(prompt_token_cache) > PROMPT_CACHE_SIZE:
+            prompt_token_cache.popitem(last=False)
+    metrics.count("prompt_cache_misses")
+    return tokens
+
+# استبدال نص السياق برموزه المحفوظة
+def with_prompt_tokens(model, decoding_options):
+    if isinstance(decoding_options.prompt, str) and decoding_options.prompt.strip():
+        return dataclasses.replace(decoding_options, prompt=prompt_tokens(model, decoding_options.prompt))
+    return decoding_options
+
+# استدلال المفكك دون تكرار الحسابات المشتركة (بديل PyTorchInference):
+# التمريرة الأولى على السياق والرموز الأولية تُحسب مرة لكل مقطع بدل مرة لكل شعاع،
+# وقيم الانتباه المتقاطع تُؤخذ من cross_cache إذا فُكت نفس الميزات الصوتية قبلها
+class SharedPrefixInference:
+    def __init__(self, model, initial_token_length, n_group, cross_cache=None):
+        self.model = model
+        self.initial_token_length = initial_token_length
+        self.n_group = n_group
+        self.cross_cache = cross_cache
+        self.kv_cache = {}
+        self.hooks = []
+        
+        blocks = model.decoder.blocks
+        self.kv_modules = [block.attn.key for block in blocks] + [block.attn.value for block in blocks]
+        self.cross_modules = [m for block in blocks for m in (block.cross_attn.key, block.cross_attn.value)]
+    
+    def logits(self, tokens, audio_features):
+        if self.kv_cache:
+            if tokens.shape[-1] > self.initial_token_length:
+                # بعد التمريرة الأولى يكفي آخر رمز
+                tokens = tokens[:, -1:]
+            return self.model.decoder(tokens, audio_features, kv_cache=self.kv_cache)
+        
+        # التمريرة الأولى: كل أشعة المقطع تبدأ بنفس الرموز، فصف واحد لكل مقطع يكفي
+        tokens = tokens[::self.n_group]
+        if audio_features.shape[0] > 1:
+            audio_features = audio_features[::self.n_group]
+        
+        seed = {}
+        if self.cross_cache:
+            # مدخلات فارغة للانتباه الذاتي أولاً: المفكك يأخذ الإزاحة الموضعية من أول قيمة في الذاكرة
+            empty = audio_features.new_zeros((tokens.shape[0], 0, self.model.dims.n_text_state))
+            seed = {module: empty for module in self.kv_modules}
+            seed.update(self.cross_cache)
+        
+        self.kv_cache, self.hooks = self.model.install_kv_cache_hooks(seed)
+        logits = self.model.decoder(tokens, audio_features, kv_cache=self.kv_cache)
+        
+        if self.cross_cache is not None and not self.cross_cache:
+            self.cross_cache.update({module: self.kv_cache[module] for module in self.cross_modules})
+        
+        if self.n_group > 1:
+            for module in self.kv_modules:
+                self.kv_cache[module] = self.kv_cache[module].repeat_interleave(self.n_group, dim=0)
+            if tokens.shape[0] > 1:
+                # مع مقطع واحد تكفي قيم الانتباه المتقاطع بصف واحد (بث تلقائي)
+                for module in self.cross_modules:
+                    self.kv_cache[module] = self.kv_cache[module].repeat_interleave(self.n_group, dim=0)
+            logits = logits.repeat_interleave(self.n_group, dim=0)
+        return logits
+    
+    def cleanup_caching(self):
+        for hook in self.hooks:
+            hook.remove()
+        
+        self.kv_cache = {}
+        self.hooks = []
+    
+    def rearrange_kv_cache(self, source_indices):
+        if source_indices != list(range(len(source_indices))):
+            for module in self.kv_modules:
+                self.kv_cache[module] = self.kv_cache[module][source_indices].detach()
+
+# فك الترميز على ميزات صوتية مرمزة مسبقاً
+# (cross_cache: قاموس مشترك بين عمليات فك ترميز نفس الميزات لإعادة قيم الانتباه المتقاطع،
+#  logit_filters: مرشحات إضافية تُطبق قبل اختيار كل رمز)
+def decode_features(model, audio_features, decoding_options, cross_cache=None, logit_filters=()):
+    task = whisper.decoding.DecodingTask(model, with_prompt_tokens(model, decoding_options))
+    task.logit_filters.extend(logit_filters)
+    n_audio = audio_features.shape[0]
+    grouped_features = audio_features
+    
+    if n_audio > 1 and task.n_group > 1:
+        # DecodingTask لا يكرر الميزات لكل شعاع عند فك دفعة من عدة مقاطع
+        grouped_features = audio_features.repeat_interleave(task.n_group, dim=0)
+        task._detect_language = lambda features, tokens: ([decoding_options.language] * n_audio, None)
+    
+    task._get_audio_features = lambda mel: grouped_features
+    task.inference = SharedPrefixInference(model, len(task.initial_tokens), task.n_group, cross_cache)
+    if hasattr(task.decoder, "inference"):
+        task.decoder.inference = task.inference  # البحث بالأشعة يعيد ترتيب الذاكرة عبر نفس الكائن
+    return task.run(audio_features)
+
+# استخراج توقيت الكلمات من الانتباه المتقاطع على مخرجات المُرمِّز الموجودة
+# (نفس خطوات whisper.timing.find_alignment دون تشغيل المُرمِّز مرة ثانية على الطيف)
+def align_words(model, options, audio_features, num_frames, tokens):
+    tokenizer = whisper.tokenizer.get_tokenizer(
+        model.is_multilingual,
+        num_languages=model.num_languages,
+        language=options.get("language"),
+        task=options.get("task", "transcribe")
+    )
+    text_tokens = [t for t in tokens if t < tokenizer.eot]
+    if not text_tokens:
+        return []
+    sequence = torch.tensor(
+        [*tokenizer.sot_sequence, tokenizer.no_timestamps, *text_tokens, tokenizer.eot]
+    ).to(model.device)
+    
+    # أوزان الانتباه المتقاطع لكل طبقة (SDPA لا يُرجعها)
+    qks = [None] * model.dims.n_text_layer
+    hooks = [
+        block.cross_attn.register_forward_hook(lambda _, ins, outs, index=i: qks.__setitem__(index, outs[-1][0]))
+        for i, block in enumerate(model.decoder.blocks)
+    ]
+    try:
+        with torch.no_grad(), whisper.model.disable_sdpa():
+            model.decoder(sequence.unsqueeze(0), audio_features[:1])
+    finally:
+        for hook in hooks:
+            hook.remove()
+    
+    weights = torch.stack([qks[layer][head] for layer, head in model.alignment_heads.indices().T])
+    weights = weights[:, :, :num_frames // 2].float().softmax(dim=-1)
+    std, mean = torch.std_mean(weights, dim=-2, keepdim=True, unbiased=False)
+    weights = whisper.timing.median_filter((weights - mean) / std, 7)
+    matrix = weights.mean(axis=0)[len(tokenizer.sot_sequence):-1]
+    text_indices, time_indices = whisper.timing.dtw(-matrix)
+    
+    words, word_tokens = tokenizer.split_to_word_tokens(text_tokens + [tokenizer.eot])
+    if len(word_tokens) <= 1:
+        return []
+    boundaries = np.pad(np.cumsum([len(t) for t in word_tokens[:-1]]), (1, 0))
+    jumps = np.pad(np.diff(text_indices), (1, 0), constant_values=1).astype(bool)
+    jump_times = time_indices[jumps] / whisper.audio.TOKENS_PER_SECOND
+    return [
+        (word, float(start), float(end))
+        for word, start, end in zip(words, jump_times[boundaries[:-1]], jump_times[boundaries[1:]])
+    ]
+
+# ----- حراسة فك الترميز -----
+
+# تكرار عبارة في نهاية سلسلة رموز: (طول العبارة، عدد نسخها المتتالية) أو None
+def trailing_repetition(tokens):
+    for n in range(1, REPETITION_MAX_NGRAM + 1):
+        copies = max(REPETITION_MIN_COPIES, -(-REPETITION_MIN_SPAN // n))
+        if len(tokens) < n * copies:
+            continue
+        gram = tokens[-n:]
+        if all(tokens[-(i + 1) * n:len(tokens) - i * n] == gram for i in range(1, copies)):
+            while len(tokens) >= (copies + 1) * n and tokens[-(copies + 1) * n:len(tokens) - copies * n] == gram:
+                copies += 1
+            return n, copies
+    return None
+
+# مرشح رموز يفرض نهاية النص فور تكرار عبارة، بدلاً من الدوران حتى حد الرموز
+class RepetitionGuard:
+    def __init__(self, eot):
+        self.eot = eot
+        self.sample_begin = None  # أول استدعاء يكون على الرموز الأولية فقط
+    
+    def apply(self, logits, tokens):
+        if self.sample_begin is None:
+            self.sample_begin = tokens.shape[1]
+        window = min(REPETITION_MAX_NGRAM * REPETITION_MIN_COPIES, tokens.shape[1] - self.sample_begin)
+        if window < REPETITION_MIN_SPAN:
+            return
+        
+        for row, sampled in enumerate(tokens[:, -window:].tolist()):
+            if sampled[-1] != self.eot and trailing_repetition(sampled):
+                logits[row, :] = -np.inf
+                logits[row, self.eot] = 0
+
+# مرشحات الحراسة لاستدعاء فك ترميز واحد (تُنشأ لكل استدعاء لأنها تحفظ حالة)
+def decode_guards(model):
+    return [RepetitionGuard(model_tokenizer(model).eot)] if config.get("repetition_guard", True) else []
+
+# قص النسخ المكررة من نهاية النتيجة وتسجيل الحراسة التي عملت عليها في guards
+def guard_result(model, result, decoding_options, guards):
+    if len(result.tokens) >= (decoding_options.sample_len or model.dims.n_text_ctx // 2):
+        guards.append("token_cap")
+    
+    repetition = trailing_repetition(result.tokens) if config.get("repetition_guard", True) else None
+    if repetition is None:
+        return result
+    n, copies = repetition
+    guards.append("repetition")
+    tokens = result.tokens[:len(result.tokens) - (copies - 1) * n]
+    return dataclasses.replace(result, tokens=tokens, text=model_tokenizer(model).decode(tokens).strip())
+
+# عتبة تجاوز المفكك للمقاطع الخالية من الكلام (0 = معطل)
+def no_speech_skip():
+    return float(config.get("no_speech_skip", NO_SPEECH_SKIP))
+
+# احتمال عدم وجود كلام من تمريرة مفكك واحدة على رمز البداية فقط (كما في كشف اللغة)؛
+# قيم الانتباه المتقاطع المحسوبة تُحفظ في cross_cache ليستخدمها فك الترميز الذي يليها
+def no_speech_probe(model, audio_features, cross_cache=None):
+    tokenizer = model_tokenizer(model)
+    tokens = torch.full((audio_features.shape[0], 1), tokenizer.sot, device=audio_features.device)
+    
+    kv_cache, hooks = model.install_kv_cache_hooks()
+    try:
+        with torch.no_grad():
+            logits = model.decoder(tokens, audio_features, kv_cache=kv_cache)
+    finally:
+        for hook in hooks:
+            hook.remove()
+    
+    if cross_cache is not None:
+        cross_cache.update({
+            module: kv_cache[module]
+            for block in model.decoder.blocks
+            for module in (block.cross_attn.key, block.cross_attn.value)
+        })
+    return logits[:, 0].softmax(dim=-1)[:, tokenizer.no_speech].tolist()
+
+# نسخ مقطع واحد: ترميز بطول المقطع ثم فك الترميز
+def transcribe_segment(model, audio, options, word_timestamps=False, min_seconds=None, translate=False, draft=None,
+                       logit_filters=()):
+    dtype = torch.float16 if options.get("fp16") else torch.float32
+    decoding_options = build_decoding_options(options)
+    speculate = can_speculate(model, draft, decoding_options)
+    
+    start = time.perf_counter()
+    mel, num_frames = prepare_mel(model, audio, min_seconds)
+    preprocess_time = time.perf_counter() - start
+    with torch.no_grad():
+        audio_features = model.encoder(mel.unsqueeze(0).to(model.device, dtype))
+        # المسودة ترمّز نفس الطيف الصوتي بمُرمِّزها الصغير
+        draft_features = draft.encoder(mel.unsqueeze(0).to(draft.device, dtype)) if speculate else None
+    encode_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    cross_cache = {}
+    draft_stats = (0, 0, 0)
+    guards = []
+    result, words, translation = None, [], None
+    no_speech_prob = no_speech_probe(model, audio_features, cross_cache)[0] if no_speech_skip() else 0.0
+    
+    if no_speech_skip() and no_speech_prob > no_speech_skip():
+        # مقطع بلا كلام: لا فك ترميز (ولا هلوسة) على الإطلاق
+        guards.append("no_speech")
+        translation = "" if translate else None
+    else:
+        filters = list(logit_filters) + decode_guards(model)
+        if speculate:
+            result, *draft_stats = speculative_decode(
+                model, draft, audio_features, draft_features, decoding_options,
+                int(config.get("draft_tokens", DRAFT_TOKENS)), filters
+            )
+        else:
+            result = decode_features(model, audio_features, decoding_options, cross_cache, filters)[0]
+        result = guard_result(model, result, decoding_options, guards)
+        words = align_words(model, options, audio_features, num_frames, result.tokens) if word_timestamps and result.tokens else []
+        # الترجمة للإنجليزية على نفس مخرجات المُرمِّز (دون سياق لأنه بلغة المصدر)
+        if translate:
+            translation = translate_features(model, audio_features, options, cross_cache, logit_filters)[0]
+    decode_time = time.perf_counter() - start
+    
+    return {
+        "text": result.text if result else "",
+        "translation": translation,
+        "words": words,
+        "no_speech_prob": result.no_speech_prob if result else no_speech_prob,
+        "avg_logprob": result.avg_logprob if result else 0.0,
+        "audio_seconds": len(audio) / SAMPLE_RATE,
+        "preprocess_time": preprocess_time,
+        "encode_time": encode_time,
+        "decode_time": decode_time,
+        "draft_proposed": draft_stats[0],
+        "draft_accepted": draft_stats[1],
+        "draft_steps": draft_stats[2],
+        "guards": guards
+    }
+
+# نسخ عدة مقاطع في دفعة واحدة للمُرمِّز والمفكك (بطول أطول مقطع في الدفعة)
+def transcribe_batch(model, audios, options, translate=False):
+    dtype = torch.float16 if options.get("fp16") else torch.float32
+    target = max(mel_target_frames(len(audio), encoder_min_seconds()) for audio in audios)
+    
+    start = time.perf_counter()
+    mels = torch.stack([prepare_mel(model, audio, target_frames=target)[0] for audio in audios])
+    preprocess_time = time.perf_counter() - start
+    with torch.no_grad():
+        audio_features = model.encoder(mels.to(model.device, dtype))
+    encode_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    decoding_options = build_decoding_options(options)
+    cross_cache = {}
+    keep = list(range(len(audios)))
+    no_speech_probs = [0.0] * len(audios)
+    if no_speech_skip():
+        # المقاطع الخالية من الكلام تُستبعد من الدفعة قبل فك الترميز
+        no_speech_probs = no_speech_probe(model, audio_features, cross_cache)
+        keep = [i for i, prob in enumerate(no_speech_probs) if prob <= no_speech_skip()]
+        if len(keep) < len(audios):
+            audio_features = audio_features[keep]
+            cross_cache = {module: value[keep] for module, value in cross_cache.items()}
+    
+    decoded = {}
+    if keep:
+        results = decode_features(model, audio_features, decoding_options, cross_cache, decode_guards(model))
+        if translate:
+            translations = translate_features(model, audio_features, options, cross_cache)
+        else:
+            translations = [None] * len(keep)
+        for index, result, translation in zip(keep, results, translations):
+            guards = []
+            decoded[index] = (guard_result(model, result, decoding_options, guards), translation, guards)
+    decode_time = time.perf_counter() - start
+    
+    items = []
+    for index, audio in enumerate(audios):
+        result, translation, guards = decoded.get(index, (None, "" if translate else None, ["no_speech"]))
+        items.append({
+            "text": result.text if result else "",
+            "translation": translation,
+            "words": [],
+            "no_speech_prob": result.no_speech_prob if result else no_speech_probs[index],
+            "avg_logprob": result.avg_logprob if result else 0.0,
+            "audio_seconds": len(audio) / SAMPLE_RATE,
+            "preprocess_time": preprocess_time / len(audios),
+            "encode_time": encode_time / len(audios),
+            "decode_time": decode_time / len(audios),
+            "guards": guards
+        })
+    return items
+
+# فك ترميز الترجمة إلى الإنجليزية من ميزات صوتية مرمزة مسبقاً
+def translate_features(model, audio_features, options, cross_cache=None, logit_filters=()):
+    decoding_options = build_decoding_options(options, task="translate", prompt=None)
+    filters = list(logit_filters) + decode_guards(model)
+    results = decode_features(model, audio_features, decoding_options, cross_cache, filters)
+    return [guard_result(model, result, decoding_options, []).text for result in results]
+
+# ----- فك الترميز التخميني -----
+
+# قناع سببي لعدة رموز جديدة بعد موضع محفوظ في الذاكرة:
+# Whisper يقص القناع بعدد الاستعلامات فقط، وهذا لا يصح إلا عندما تكون الذاكرة فارغة
+class OffsetCausalMask:
+    def __init__(self, mask, offset):
+        self.mask = mask
+        self.offset = offset
+    
+    def __getitem__(self, index):
+        n = index[0].stop
+        return self.mask[self.offset:self.offset + n, :self.offset + n]
+
+# عدد الرموز المحفوظة في ذاكرة الانتباه الذاتي للمفكك
+def cached_length(model, kv_cache):
+    key = model.decoder.blocks[0].attn.key
+    return kv_cache[key].shape[1] if key in kv_cache else 0
+
+# قص ذاكرة الانتباه الذاتي بعد رفض اقتراحات (الانتباه المتقاطع لا يتغير)
+def truncate_self_attention(model, kv_cache, length):
+    for block in model.decoder.blocks:
+        for module in (block.attn.key, block.attn.value):
+            kv_cache[module] = kv_cache[module][:, :length]
+
+# تمريرة مفكك على رموز جديدة فقط، تبدأ من آخر موضع محفوظ في الذاكرة
+def decoder_step(model, tokens, audio_features, kv_cache):
+    decoder = model.decoder
+    offset = cached_length(model, kv_cache)
+    tokens = torch.tensor([tokens], device=audio_features.device)
+    
+    x = decoder.token_embedding(tokens) + decoder.positional_embedding[offset:offset + tokens.shape[-1]]
+    x = x.to(audio_features.dtype)
+    
+    mask, attention = decoder.mask, contextlib.nullcontext()
+    if offset and tokens.shape[-1] > 1:
+        # SDPA يطبق القناع السببي من أول موضع، فيُستخدم مسار الانتباه الصريح مع قناع مُزاح
+        mask, attention = OffsetCausalMask(decoder.mask, offset), whisper.model.disable_sdpa()
+    with attention:
+        for block in decoder.blocks:
+            x = block(x, audio_features, mask=mask, kv_cache=kv_cache)
+    
+    x = decoder.ln(x)
+    return (x @ torch.transpose(decoder.token_embedding.weight.to(x.dtype), 0, 1)).float()
+
+# اختيار الرمز الجشع بعد مرشحات Whisper (منع الفراغ والرموز المحظورة) مع احتماله اللوغاريتمي
+def greedy_choice(task, logits, tokens):
+    logits = logits.float().unsqueeze(0).clone()
+    context = torch.tensor([tokens], device=logits.device)
+    for logit_filter in task.logit_filters:
+        logit_filter.apply(logits, context)
+    
+    token = int(logits.argmax(dim=-1))
+    return token, float(torch.log_softmax(logits, dim=-1)[0, token])
+
+# هل يمكن التحقق من اقتراحات المسودة بهذا النموذج وهذه الخيارات؟
+def can_speculate(target, draft, decoding_options):
+    return (
+        draft is not None
+        and draft is not target
+        and decoding_options.beam_size is None  # البحث بالأشعة يُفك بالمسار العادي
+        and decoding_options.best_of is None
+        and decoding_options.temperature == 0.0
+        and draft_compatible(target, draft)
+    )
+
+# نموذج المسودة يجب أن يشارك الهدف نفس المفردات والطيف الصوتي
+def draft_compatible(target, draft):
+    return (
+        target.is_multilingual == draft.is_multilingual
+        and target.num_languages == draft.num_languages
+        and target.dims.n_vocab == draft.dims.n_vocab
+        and target.dims.n_mels == draft.dims.n_mels
+    )
+
+# فك ترميز جشع تخميني: المسودة تقترح عدة رموز والهدف يتحقق منها في تمريرة واحدة.
+# الناتج مطابق لفك الترميز الجشع بالنموذج الهدف؛ تُرجع (النتيجة، المقترحة، المقبولة، خطوات التحقق)
+def speculative_decode(target, draft, target_features, draft_features, decoding_options, draft_tokens=DRAFT_TOKENS,
+                       logit_filters=()):
+    task = whisper.decoding.DecodingTask(target, with_prompt_tokens(target, decoding_options))
+    task.logit_filters.extend(logit_filters)
+    tokenizer = task.tokenizer
+    tokens = list(task.initial_tokens)
+    limit = min(task.sample_begin + task.sample_len, task.n_ctx)
+    proposed = accepted = steps = 0
+    sum_logprob = 0.0
+    
+    target_cache, target_hooks = target.install_kv_cache_hooks()
+    draft_cache, draft_hooks = draft.install_kv_cache_hooks()
+    try:
+        with torch.no_grad():
+            logits = decoder_step(target, tokens, target_features, target_cache)
+            no_speech_prob = float(logits[0, task.sot_index].softmax(dim=-1)[tokenizer.no_speech])
+            decoder_step(draft, tokens, draft_features, draft_cache)
+            choices = [greedy_choice(task, logits[0, -1], tokens)]
+            
+            finished = False
+            while not finished:
+                # تطبيق اختيارات الهدف: الاقتراحات المقبولة ثم رمز التصحيح أو الرمز الإضافي
+                for token, logprob in choices:
+                    if len(tokens) >= limit:
+                        finished = True
+                        break
+                    sum_logprob += logprob
+                    if token == tokenizer.eot:
+                        finished = True
+                        break
+                    tokens.append(token)
+                if finished or len(tokens) >= limit:
+                    break
+                
+                # الذاكرتان تغطيان كل الرموز المقبولة عدا الأخير
+                truncate_self_attention(target, target_cache, len(tokens) - 1)
+                truncate_self_attention(draft, draft_cache, min(cached_length(draft, draft_cache), len(tokens) - 1))
+                
+                # المسودة تقترح حتى draft_tokens رموز بعد آخر رمز مقبول
+                proposals = []
+                feed = tokens[cached_length(draft, draft_cache):]
+                for _ in range(min(draft_tokens, limit - len(tokens))):
+                    draft_logits = decoder_step(draft, feed, draft_features, draft_cache)
+                    proposal = greedy_choice(task, draft_logits[0, -1], tokens + proposals)[0]
+                    proposals.append(proposal)
+                    if proposal == tokenizer.eot:
+                        break
+                    feed = [proposal]
+                
+                # الهدف يتحقق من كل الاقتراحات في تمريرة واحدة ويتوقف عند أول اختلاف
+                verify_logits = decoder_step(target, [tokens[-1]] + proposals, target_features, target_cache)[0]
+                choices = []
+                for i in range(len(proposals) + 1):
+                    choice = greedy_choice(task, verify_logits[i], tokens + proposals[:i])
+                    choices.append(choice)
+                    if i == len(proposals) or choice[0] != proposals[i] or choice[0] == tokenizer.eot:
+                        break
+                
+                steps += 1
+                proposed += len(proposals)
+                accepted += sum(1 for (token, _), proposal in zip(choices, proposals) if token == proposal)
+    finally:
+        for hook in target_hooks + draft_hooks:
+            hook.remove()
+    
+    sampled = tokens[task.sample_begin:]
+    text = tokenizer.decode(sampled).strip()
+    result = whisper.DecodingResult(
+        audio_features=target_features[0],
+        language=decoding_options.language,
+        tokens=sampled,
+        text=text,
+        avg_logprob=sum_logprob / (len(sampled) + 1),
+        no_speech_prob=no_speech_prob,
+        temperature=0.0,
+        compression_ratio=whisper.utils.compression_ratio(text)
+    )
+    return result, proposed, accepted, steps
 
 # البحث عن جهاز الصوت
 def get_system_audio_device():
@@ -375,153 +1726,876 @@ def get_system_audio_device():
     print("⚠ لم يتم العثور على جهاز صوت النظام، سيتم استخدام الإدخال الافتراضي.")
     return None
 
-# تحسين اكتشاف الكلام
-def is_speech(audio_chunk, vad):
-    if len(audio_chunk) != FRAME_SIZE:
-        return False
+# إرسال بيانات للواجهة وإيقاظ حلقة Tk بحدث واحد بدلاً من الاستطلاع الدوري
+def post_subtitle(data):
+    subtitle_queue.put(data)
     
-    # التحقق من مستوى الصوت
-    audio_level = np.sqrt(np.mean(np.square(audio_chunk)))
-    if audio_level < 0.01:  # تجاهل الصوت الخافت جداً
-        return False
-    
-    # التحقق باستخدام VAD
-    audio_int16 = (audio_chunk * 32768).astype(np.int16)
-    try:
-        return vad.is_speech(audio_int16.tobytes(), SAMPLE_RATE)
-    except Exception:
-        # إذا فشل VAD، استخدم فقط مستوى الصوت
-        return audio_level > 0.02
+    root = ui_root
+    if root is not None and not ui_wake_pending.is_set():
+        ui_wake_pending.set()
+        try:
+            root.event_generate("<<SubtitleUpdate>>", when="tail")
+        except Exception:
+            # النافذة أُغلقت أو لم تعد متاحة
+            ui_wake_pending.clear()
 
-# وظيفة التقاط الصوت المحسنة
+# حالة خط التقطيع: يبدأ قبل جاهزية النموذج، فتبقى "Loading model..." ظاهرة حتى ينتهي التسخين
+def post_segmenter_status(status):
+    if model_ready.is_set():
+        post_subtitle(("status", status))
+
+# إغلاق المقطع الحالي وإرساله كمقطع نهائي
+def finish_segment():
+    global silence_counter, last_segment_time, is_speaking, utterance_id, next_partial_at
+    
+    is_speaking = False
+    trace = metrics.new_trace(capture=block_captured_at, vad=clock())
+    if not processing_queue.put(speech_buffer.copy(), True, utterance_id, trace):  # True = نهاية الجملة
+        print("⚠ قائمة الانتظار ممتلئة، تجاهل المقطع الصوتي")
+    
+    # إعادة تعيين المخزن المؤقت وبدء عبارة جديدة
+    speech_buffer.clear()
+    next_partial_at = 0
+    utterance_id += 1
+    silence_counter = 0
+    last_segment_time = clock()
+    post_segmenter_status("Processing...")
+
+# وظيفة التقاط الصوت: نسخ العينات فقط إلى مخزن الالتقاط دون أي معالجة
 def audio_callback(indata, frames, time_info, status):
-    global silence_counter, last_speech_time, last_segment_time, audio_buffer, is_speaking
+    global capture_dropped, last_capture_time
     
     if status and (status.input_overflow or "error" in str(status).lower()):
         print(f"⚠ خطأ في الصوت: {status}")
         return
     
-    try:
-        # تحويل البيانات إلى شكل مناسب للمعالجة
-        audio_data = indata.flatten().astype(np.float32)
+    written = capture_buffer.write(indata[:, 0])
+    if written < frames:
+        capture_dropped += frames - written
+    last_capture_time = clock()
+    capture_event.set()
+
+# خيط التقطيع: اكتشاف الكلام وتجميع المقاطع خارج خيط PortAudio
+def segmenter_task():
+    global stream_position, block_captured_at
+    reported_dropped = 0
+    pending = np.zeros(0, dtype=np.float32)  # بقية الكتلة السابقة التي لم تكتمل إطاراتها
+    
+    while not pipeline_stop.is_set():
+        capture_event.wait(timeout=0.5)
+        capture_event.clear()
         
-        # معالجة الصوت في إطارات
-        for i in range(0, len(audio_data) - FRAME_SIZE + 1, FRAME_SIZE // 2):  # تداخل الإطارات لتحسين الدقة
-            frame = audio_data[i:i + FRAME_SIZE]
-            
-            # تحديد إذا كان الإطار يحتوي على كلام
-            speech_detected = is_speech(frame, vad)
+        if len(capture_buffer):
+            block_captured_at = last_capture_time
+            # الفلترة تتم هنا مرة واحدة فقط لكل عينة جديدة
+            samples = process_audio(capture_buffer.read(len(capture_buffer)))
+            audio_data = np.concatenate((pending, samples))
+            consumed = segment_block(audio_data)
+            pending = audio_data[consumed:]
+            stream_position += consumed
+        
+        if capture_dropped != reported_dropped:
+            print(f"⚠ امتلأ مخزن الالتقاط، فُقدت {capture_dropped - reported_dropped} عينة")
+            reported_dropped = capture_dropped
+
+# اكتشاف الكلام في كل إطارات الكتلة دفعة واحدة
+def detect_speech_frames(audio_data, vad):
+    if len(audio_data) < FRAME_SIZE:
+        return np.zeros(0, dtype=bool)
+    
+    # حساب مستوى الصوت لكل الإطارات المتداخلة بعملية واحدة بدون نسخ
+    frames = np.lib.stride_tricks.sliding_window_view(audio_data, FRAME_SIZE)[::FRAME_HOP]
+    levels = np.sqrt(np.einsum("ij,ij->i", frames, frames) / FRAME_SIZE)
+    decisions = levels >= 0.01  # تجاهل الصوت الخافت جداً
+    
+    # تحويل واحد للكتلة كاملة، واستدعاء VAD فقط للإطارات التي تجاوزت العتبة
+    if decisions.any():
+        audio_int16 = (audio_data * 32768).astype(np.int16)
+        for index in np.flatnonzero(decisions):
+            start = index * FRAME_HOP
+            try:
+                decisions[index] = vad.is_speech(audio_int16[start:start + FRAME_SIZE].tobytes(), SAMPLE_RATE)
+            except Exception:
+                # إذا فشل VAD، استخدم فقط مستوى الصوت
+                decisions[index] = levels[index] > 0.02
+    
+    return decisions
+
+# اكتشاف الكلام في كتلة صوتية وتحديث المقطع الحالي؛ تُرجع عدد العينات المستهلكة
+def segment_block(audio_data):
+    global silence_counter, last_speech_time, is_speaking, speech_written_until, next_partial_at
+    
+    decisions = detect_speech_frames(audio_data, vad)
+    
+    try:
+        for index, speech_detected in enumerate(decisions):
+            start = index * FRAME_HOP
             
             if speech_detected:
                 if not is_speaking:
                     # بداية مقطع جديد
                     is_speaking = True
-                    subtitle_queue.put(("status", "Listening..."))
+                    post_segmenter_status("Listening...")
                 
-                # إضافة الإطار إلى المخزن المؤقت
-                audio_buffer.append(frame)
+                # إضافة العينات الجديدة فقط من الإطار (بدون تكرار الجزء المتداخل)
+                new_from = max(start, speech_written_until - stream_position)
+                speech_buffer.write(audio_data[new_from:start + FRAME_SIZE] * current_gain())
+                speech_written_until = stream_position + start + FRAME_SIZE
                 silence_counter = 0
-                last_speech_time = time.time()
+                last_speech_time = clock()
+                
+                # المخزن ممتلئ: إغلاق المقطع بدلاً من فقدان العينات
+                if speech_buffer.free() < FRAME_SIZE:
+                    finish_segment()
                 
                 # إرسال أجزاء صغيرة بشكل مستمر للمعالجة المبكرة
-                if len(audio_buffer) >= 15 and len(audio_buffer) % 5 == 0:  # كل ~150ms من الكلام المتواصل
-                    if processing_queue.qsize() < 2:  # تجنب الازدحام
-                        # أخذ نسخة من المخزن المؤقت الحالي للمعالجة المبكرة
-                        current_segment = np.concatenate(audio_buffer)
-                        processing_queue.put((current_segment, False))  # False = ليس نهاية الجملة
+                elif len(speech_buffer) >= max(next_partial_at, SAMPLE_RATE * PARTIAL_MIN_DURATION):
+                    next_partial_at = len(speech_buffer) + int(SAMPLE_RATE * PARTIAL_INTERVAL)
+                    # أخذ نسخة متصلة واحدة من المخزن الحالي للمعالجة المبكرة
+                    # (المجدول يستبدل أي جزء منتظر لنفس العبارة بهذا الأحدث)
+                    trace = metrics.new_trace(capture=block_captured_at, vad=clock())
+                    processing_queue.put(speech_buffer.copy(), False, utterance_id, trace)  # False = ليس نهاية الجملة
             else:
                 # تحديث عداد الصمت
                 silence_counter += 1
                 
                 # حساب مدة الصمت
-                silence_duration = silence_counter * (FRAME_SIZE / SAMPLE_RATE / 2)  # تعديل بسبب التداخل
+                silence_duration = silence_counter * (FRAME_HOP / SAMPLE_RATE)
                 
                 # إرسال المقطع عند اكتشاف صمت أو تجاوز الحد الأقصى للمدة
                 if is_speaking and (silence_duration >= SILENCE_THRESHOLD or 
-                                   time.time() - last_segment_time >= MAX_SEGMENT_DURATION) and len(audio_buffer) > 10:
-                    
-                    if audio_queue.qsize() < MAX_QUEUE_SIZE:
-                        full_segment = np.concatenate(audio_buffer)
-                        is_speaking = False
-                        audio_queue.put(full_segment)
-                        processing_queue.put((full_segment, True))  # True = نهاية الجملة
-                    else:
-                        print("⚠ قائمة الانتظار ممتلئة، تجاهل المقطع الصوتي")
-                    
-                    # إعادة تعيين المخزن المؤقت
-                    audio_buffer.clear()
-                    silence_counter = 0
-                    last_segment_time = time.time()
-                    subtitle_queue.put(("status", "Processing..."))
+                                   clock() - last_segment_time >= MAX_SEGMENT_DURATION) and \
+                        len(speech_buffer) > SAMPLE_RATE * MIN_FINAL_DURATION:
+                    finish_segment()
     
     except Exception as e:
         print(f"⚠ خطأ في معالجة الصوت: {e}")
+    
+    return len(decisions) * FRAME_HOP
 
-# مهمة نسخ الصوت محسنة
-def transcribe_task():
-    global previous_text, context_buffer
+# توحيد الكلمة للمقارنة بين الفرضيات المتتالية
+def normalize_word(word):
+    return "".join(ch for ch in word.lower() if ch.isalnum())
+
+# إعادة تعيين حالة فك الترميز المتدفق
+def reset_stream_state(segment_utterance=None):
+    stream_state["utterance_id"] = segment_utterance
+    stream_state["committed"] = []
+    stream_state["committed_until"] = 0
+    stream_state["hypothesis"] = []
+
+# إرجاع الذيل غير المثبت من العبارة مع موضع بدايته
+def streaming_tail(segment_utterance, audio_segment):
+    if stream_state["utterance_id"] != segment_utterance:
+        # عبارة جديدة: إعادة تعيين الحالة
+        reset_stream_state(segment_utterance)
+    
+    offset = min(stream_state["committed_until"], len(audio_segment))
+    return audio_segment[offset:], offset
+
+# تثبيت البادئة المتفق عليها بين الفرضية الحالية والسابقة (LocalAgreement)
+def streaming_commit(words):
+    committed_seconds = stream_state["committed_until"] / SAMPLE_RATE
+    
+    # تجاهل الكلمات التي سبق تثبيتها
+    new_words = [w for w in words if w[2] > committed_seconds + 0.01]
+    previous = stream_state["hypothesis"]
+    
+    agreed = 0
+    while (agreed < len(new_words) and agreed < len(previous) and
+           normalize_word(new_words[agreed][0]) == normalize_word(previous[agreed][0])):
+        agreed += 1
+    
+    if agreed:
+        stream_state["committed"].extend(w[0] for w in new_words[:agreed])
+        stream_state["committed_until"] = int(new_words[agreed - 1][2] * SAMPLE_RATE)
+    stream_state["hypothesis"] = new_words[agreed:]
     
-    # إعداد خيارات النسخ
-    transcribe_options = {
-        "fp16": (torch.cuda.is_available()),
+    return committed_text() + "".join(w[0] for w in stream_state["hypothesis"])
+
+# النص المثبت حتى الآن في العبارة الحالية
+def committed_text():
+    return "".join(stream_state["committed"])
+
+# خيارات النسخ الأساسية
+def build_transcribe_options():
+    return {
+        "fp16": get_device() == "cuda",
         "language": config.get("language", "de"),
         "task": "transcribe",
         "beam_size": 3,
         "best_of": 1,
         "temperature": 0.0
     }
+
+# إعداد النص السابق والنص المثبت كسياق إذا كان متوفراً
+def apply_prompt(transcribe_options, include_committed=True):
+    with context_lock:
+        prompt = " ".join(context_buffer[-3:])
+    if include_committed:
+        prompt += committed_text()
+    prompt = prompt[-STREAM_PROMPT_CHARS:].strip()
+    if prompt:
+        transcribe_options["prompt"] = prompt
+    else:
+        transcribe_options.pop("prompt", None)
+
+# سياسة فك الترميز لنوع المقطع (الإعدادات فوق القيم الافتراضية)
+def decode_policy(is_final):
+    kind = "final" if is_final else "partial"
+    return dict(DEFAULT_DECODE_POLICIES[kind], **config.get("decode_policies", {}).get(kind, {}))
+
+# خيارات فك الترميز لمقطع حسب سياسة نوعه وطول صوته
+def apply_decode_policy(transcribe_options, is_final, n_samples):
+    policy = decode_policy(is_final)
+    options = dict(transcribe_options, beam_size=policy["beam_size"], best_of=policy["best_of"])
+    
+    # حد الرموز: ثابت، أو متناسب مع مدة الصوت، أو الأصغر بينهما
+    caps = []
+    if policy["max_tokens"]:
+        caps.append(int(policy["max_tokens"]))
+    if policy["tokens_per_second"]:
+        caps.append(max(MIN_TOKEN_CAP, int(np.ceil(policy["tokens_per_second"] * n_samples / SAMPLE_RATE))))
+    if caps:
+        options["sample_len"] = min(caps)
+    
+    if not policy["use_prompt"]:
+        options.pop("prompt", None)
+    return options
+
+# إرسال النص للعرض وتحديث السياق
+def publish_text(detected_text, is_final, trace=None, translation=None, audio=None):
+    # تحديث فقط إذا كان هناك نص
+    if not detected_text:
+        return
+    
+    if is_final:
+        # تخزين النص في buffer السياق مع الاحتفاظ بآخر 5 جمل فقط
+        with context_lock:
+            context_buffer.append(detected_text)
+            del context_buffer[:-5]
+    
+    # إرسال النص للعرض (مع طوابع المقطع لقياس زمن العرض)
+    if trace is not None:
+        trace["publish"] = clock()
+    if translation is not None:
+        # حدث مزدوج: النص الأصلي والترجمة يُعرضان معاً في سطرين
+        post_subtitle(("dual", detected_text, is_final, trace, translation.strip()))
+    else:
+        post_subtitle(("text", detected_text, is_final, trace))
+    
+    # طباعة في الكونسول للتصحيح
+    status = "FINAL" if is_final else "PARTIAL"
+    print(f"📝 [{status}]: {detected_text}")
+    if translation is not None:
+        print(f"🌐 [{status}]: {translation.strip()}")
+    
+    if is_final and trace is not None:
+        # حفظ السطر النهائي وصوته حتى يمكن تحسينه لاحقاً
+        if transcript is not None:
+            transcript.add(trace["id"], subtitle_text(detected_text, translation))
+        if audio is not None and config.get("refinement", False):
+            refine_segments.append((trace["id"], audio, detected_text, translation))
+            refine_wakeup.set()
+
+# نص السطر المعروض: النص الأصلي وتحته الترجمة في الوضع المزدوج
+def subtitle_text(text, translation=None):
+    return f"{text}\n{translation.strip()}".strip() if translation is not None else text
+
+# نسخ مقطع واحد (جزئي أو نهائي)؛ تُرجع نتائج فك الترميز (فارغة إذا لم يُفك شيء)
+def transcribe_one(audio_segment, is_final, segment_utterance, trace, transcribe_options):
+    # إذا كان المقطع صغيراً جداً، تجاهله
+    if len(audio_segment) < SAMPLE_RATE * 0.3:  # أقل من 300 مللي ثانية
+        return []
+    
+    # فك ترميز الذيل غير المثبت فقط بدلاً من العبارة كاملة
+    # (في الوضع المزدوج تُفك العبارة كاملة لتغطي الترجمة نفس الصوت)
+    dual = config.get("dual_output", False)
+    if dual:
+        streaming_tail(segment_utterance, audio_segment)
+        tail, tail_offset = audio_segment, 0
+    else:
+        tail, tail_offset = streaming_tail(segment_utterance, audio_segment)
+    results = []
+    translation = None
+    
+    if len(tail) < SAMPLE_RATE * MIN_TAIL_DURATION:
+        if not is_final:
+            return results
+        # كل النص مثبت مسبقاً، لا حاجة لفك ترميز جديد
+        detected_text = committed_text().strip()
+    else:
+        # تحديث حالة المعالجة
+        post_subtitle(("status", "Transcribing..."))
+        apply_prompt(transcribe_options, include_committed=not dual)
+        
+        # النسخ باستخدام Whisper (مع توقيت الكلمات للمقاطع الجزئية)
+        result = transcribe_segment(
+            MODEL,
+            tail,
+            quality_controller.decode_options(apply_decode_policy(transcribe_options, is_final, len(tail))),
+            word_timestamps=not is_final,
+            translate=dual,
+            draft=DRAFT_MODEL
+        )
+        results.append(result)
+        translation = result["translation"]
+        
+        if is_final and dual:
+            detected_text = result["text"].strip()
+        elif is_final:
+            # العبارة انتهت: النص المثبت + نص الذيل
+            detected_text = (committed_text() + " " + result["text"].strip()).strip()
+        else:
+            # تحويل توقيت الكلمات إلى موضعها داخل العبارة
+            tail_start = tail_offset / SAMPLE_RATE
+            words = [(w, start + tail_start, end + tail_start) for w, start, end in result["words"]]
+            detected_text = streaming_commit(words).strip()
+    
+    if is_final:
+        # إعادة تعيين حالة العبارة بعد انتهائها
+        reset_stream_state()
+    
+    publish_text(detected_text, is_final, trace, translation, audio_segment)
+    return results
+
+# نسخ عدة مقاطع نهائية متراكمة في دفعة واحدة؛ تُرجع نتائج فك الترميز
+def transcribe_finals_batch(batch, transcribe_options):
+    dual = config.get("dual_output", False)
+    prefixes, tails, traces, audios = [], [], [], []
+    for audio_segment, _, segment_utterance, trace in batch:
+        if len(audio_segment) < SAMPLE_RATE * 0.3:  # أقل من 300 مللي ثانية
+            continue
+        tail, _ = streaming_tail(segment_utterance, audio_segment)
+        if dual:
+            tail = audio_segment
+        traces.append(trace)
+        audios.append(audio_segment)
+        prefixes.append("" if dual else committed_text())
+        tails.append(tail if len(tail) >= SAMPLE_RATE * MIN_TAIL_DURATION else None)
+        reset_stream_state()
+    
+    pending = [tail for tail in tails if tail is not None]
+    results = []
+    if pending:
+        post_subtitle(("status", "Transcribing..."))
+        # نفس السياق لكل الدفعة (آخر الجمل قبل بدايتها)
+        apply_prompt(transcribe_options, include_committed=False)
+        decode_options = quality_controller.decode_options(apply_decode_policy(transcribe_options, True, max(map(len, pending))))
+        results = transcribe_batch(MODEL, pending, decode_options, translate=dual)
+    
+    decoded = iter(results)
+    for prefix, tail, trace, audio_segment in zip(prefixes, tails, traces, audios):
+        result = next(decoded) if tail is not None else {"text": "", "translation": "" if dual else None}
+        publish_text((prefix + " " + result["text"].strip()).strip(), True, trace, result["translation"], audio_segment)
+    return results
+
+# الإبلاغ عن المقاطع التي أسقطها المجدول لتجاوز موعدها
+def report_dropped_segments(reported_dropped):
+    dropped = processing_queue.counters["dropped_deadline"]
+    if dropped != reported_dropped:
+        print(f"⚠ تم إسقاط {dropped - reported_dropped} مقطع متأخر ({processing_queue.stats()})")
+    return dropped
+
+# مهمة نسخ الصوت محسنة
+def transcribe_task():
+    if not wait_for_model():
+        return
+    batch_size = int(config.get("batch_max_size", 4))
+    batch_wait = float(config.get("batch_max_wait", 0.1))
+    reported_dropped = 0
     
     while True:
         try:
-            if not processing_queue.empty():
-                audio_segment, is_final = processing_queue.get()
-                
-                # إذا كان المقطع صغيراً جداً، تجاهله
-                if len(audio_segment) < SAMPLE_RATE * 0.3:  # أقل من 300 مللي ثانية
-                    continue
-                
-                # معالجة الصوت
-                audio_processed = process_audio(audio_segment)
-                
-                # تحديث حالة المعالجة
-                subtitle_queue.put(("status", "Transcribing..."))
-                
-                # إعداد النص السابق كسياق إذا كان متوفراً
-                prompt = " ".join(context_buffer[-3:]) if context_buffer else ""
-                if prompt:
-                    transcribe_options["prompt"] = prompt
-                
-                # النسخ باستخدام Whisper
-                result = MODEL.transcribe(
-                    audio_processed,
-                    **transcribe_options
-                )
-                
-                # الحصول على النص
-                detected_text = result["text"].strip()
-                
-                # تحديث فقط إذا كان هناك نص
-                if detected_text:
-                    if is_final:
-                        # تخزين النص في buffer السياق
-                        context_buffer.append(detected_text)
-                        # الاحتفاظ بآخر 5 جمل فقط
-                        if len(context_buffer) > 5:
-                            context_buffer = context_buffer[-5:]
-                    
-                    # إرسال النص للعرض
-                    subtitle_queue.put(("text", detected_text, is_final))
-                    
-                    # طباعة في الكونسول للتصحيح
-                    status = "FINAL" if is_final else "PARTIAL"
-                    print(f"📝 [{status}]: {detected_text}")
-            else:
-                time.sleep(0.05)
+            # انتظار المقطع التالي دون استطلاع (أو دفعة من النهائية عند التراكم)
+            batch = processing_queue.get_batch(batch_size, batch_wait)
+            if not batch:
+                break  # أُغلقت القائمة
+            reported_dropped = report_dropped_segments(reported_dropped)
+            
+            # الخيارات تُبنى لكل مقطع حتى يُطبق تغيير اللغة من الإعدادات فوراً
+            transcribe_options = build_transcribe_options()
+            
+            start = time.perf_counter()
+            with decode_lock:
+                if len(batch) > 1:
+                    results = transcribe_finals_batch(batch, transcribe_options)
+                else:
+                    results = transcribe_one(*batch[0], transcribe_options)
+            
+            # RTF على الصوت الذي فُك ترميزه فعلاً (الذيل غير المثبت)
+            for result in results:
+                metrics.observe_result(result)
+            audio_seconds = sum(result["audio_seconds"] for result in results)
+            quality_controller.observe(audio_seconds, time.perf_counter() - start, processing_queue.last_wait)
                 
         except Exception as e:
             print(f"⚠ خطأ في النسخ: {e}")
             time.sleep(0.1)
 
+# ----- مجمع عمليات النسخ -----
+
+# حلقة عملية النسخ: نموذج خاص بالعملية، والصوت يُقرأ من الذاكرة المشتركة
+def pool_worker_main(model_name, settings, torch_threads, task_queue, result_queue):
+    global MODELS_DIR
+    config.update(settings)
+    MODELS_DIR = settings.get("models_dir", MODELS_DIR)
+    torch.set_num_threads(torch_threads)
+    
+    try:
+        model = load_whisper_model(model_name)
+        warm_up_model(model)
+        draft = load_draft_model(model, lambda name: model if name == model_name else load_whisper_model(name))
+        load_error = None
+    except Exception as e:
+        # الرد على كل مقطع بالخطأ حتى لا ينتظر خيط النشر إلى الأبد
+        model, draft, load_error = None, None, f"خطأ في تحميل النموذج: {e}"
+    
+    # إشارة الجاهزية (رقم تسلسل سالب)
+    result_queue.put((-1, None, load_error))
+    
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        
+        seq, memory_name, n_samples, options, word_timestamps, translate = task
+        if load_error:
+            result_queue.put((seq, None, load_error))
+            continue
+        
+        try:
+            memory = shared_memory.SharedMemory(name=memory_name)
+            try:
+                view = np.ndarray((n_samples,), dtype=np.float32, buffer=memory.buf)
+                audio = view.copy()
+                del view
+            finally:
+                memory.close()
+            result = transcribe_segment(model, audio, options, word_timestamps, translate=translate, draft=draft)
+            result_queue.put((seq, result, None))
+        except Exception as e:
+            result_queue.put((seq, None, str(e)))
+
+class PoolClosed(Exception):
+    """المجمع أُغلق (استُبدل بمجمع نموذج آخر) ولم يعد يقبل مقاطع"""
+
+# توزيع المقاطع على عدة عمليات، لكل منها نموذجها وخيوط torch الخاصة بها
+class TranscriptionPool:
+    def __init__(self, model_name, size, torch_threads=0):
+        self.size = size
+        if torch_threads <= 0:
+            torch_threads = max(1, (os.cpu_count() or 1) // size)
+        
+        settings = dict(config, models_dir=MODELS_DIR)
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=pool_worker_main,
+                args=(model_name, settings, torch_threads, self._tasks, self._results),
+                daemon=True
+            )
+            for _ in range(size)
+        ]
+        
+        self._slots = threading.Semaphore(size)  # مقطع واحد قيد التنفيذ لكل عملية
+        self._lock = threading.Condition()
+        self._memory = {}  # رقم التسلسل -> الذاكرة المشتركة للمقطع
+        self._done = {}    # رقم التسلسل -> (النتيجة، الخطأ)
+        self._next_seq = 0
+        self._ready = 0    # عدد العمليات التي حملت نموذجها وسخنته
+        self._load_errors = []
+        self._closed = False
+        self._submitting = 0  # عمليات إرسال جارية (قد تنتظر مكاناً في العمليات)
+    
+    def start(self):
+        for process in self._processes:
+            process.start()
+        threading.Thread(target=self._collect, daemon=True).start()
+    
+    def stop(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+    
+    def busy(self):
+        """هل توجد مقاطع قيد الإرسال أو التنفيذ في العمليات"""
+        with self._lock:
+            return bool(self._memory or self._submitting)
+    
+    def close(self):
+        """رفض المقاطع الجديدة ثم إيقاف العمليات بعد اكتمال المقاطع المرسلة إليها"""
+        with self._lock:
+            self._closed = True
+            while self._memory or self._submitting:
+                self._lock.wait()
+        self.stop()
+    
+    def wait_ready(self):
+        """انتظار تحميل النموذج وتسخينه في كل العمليات؛ تُرجع أول خطأ إن وجد"""
+        with self._lock:
+            while self._ready < self.size:
+                self._lock.wait()
+            return self._load_errors[0] if self._load_errors else None
+    
+    def submit(self, audio, options, word_timestamps=False, translate=False):
+        """إرسال مقطع لأول عملية متاحة؛ تنتظر إذا كانت كل العمليات مشغولة.
+        ترفع PoolClosed إذا أُغلق المجمع قبل الإرسال أو أثناء الانتظار"""
+        with self._lock:
+            if self._closed:
+                raise PoolClosed()
+            self._submitting += 1
+        
+        try:
+            self._slots.acquire()
+            with self._lock:
+                if self._closed:
+                    self._slots.release()
+                    raise PoolClosed()
+            
+            audio = np.ascontiguousarray(audio, dtype=np.float32)
+            memory = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+            view = np.ndarray(audio.shape, dtype=np.float32, buffer=memory.buf)
+            view[:] = audio
+            del view
+            
+            with self._lock:
+                seq = self._next_seq
+                self._next_seq += 1
+                self._memory[seq] = memory
+            
+            # يُرسل قبل إنهاء _submitting حتى يسبق رسائل الإيقاف في القائمة
+            self._tasks.put((seq, memory.name, len(audio), dict(options), word_timestamps, translate))
+            return seq
+        finally:
+            with self._lock:
+                self._submitting -= 1
+                self._lock.notify_all()
+    
+    def result(self, seq):
+        """انتظار نتيجة مقطع محدد"""
+        with self._lock:
+            while seq not in self._done:
+                self._lock.wait()
+            result, error = self._done.pop(seq)
+        
+        self._slots.release()
+        if error:
+            raise RuntimeError(error)
+        return result
+    
+    def _collect(self):
+        while True:
+            seq, result, error = self._results.get()
+            with self._lock:
+                if seq < 0:
+                    self._ready += 1
+                    if error:
+                        self._load_errors.append(error)
+                    self._lock.notify_all()
+                    continue
+                memory = self._memory.pop(seq, None)
+                self._done[seq] = (result, error)
+                self._lock.notify_all()
+            
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+
+# إرسال مقطع للمجمع الحالي؛ إذا أُغلق المجمع أثناء الانتظار (تبديل النموذج) يُعاد الإرسال للمجمع الجديد
+def submit_to_pool(audio, options, **kwargs):
+    while True:
+        worker_pool = pool
+        try:
+            return worker_pool, worker_pool.submit(audio, options, **kwargs)
+        except PoolClosed:
+            continue
+
+# انتظار جاهزية النموذج؛ تُرجع False إذا أُوقف خط المعالجة قبلها (فشل التحميل أو إغلاق النافذة)
+def wait_for_model():
+    while not model_ready.wait(0.1):
+        if pipeline_stop.is_set():
+            return False
+    return True
+
+# مهمة التوزيع: تحضير الذيل والسياق وإرسال المقطع للمجمع دون انتظار نتيجته
+def pool_dispatch_task():
+    if not wait_for_model():
+        return
+    reported_dropped = 0
+    
+    while True:
+        try:
+            item = processing_queue.get()
+            if item is None:
+                break  # أُغلقت القائمة
+            audio_segment, is_final, segment_utterance, trace = item
+            reported_dropped = report_dropped_segments(reported_dropped)
+            transcribe_options = build_transcribe_options()
+            worker_pool = pool  # المجمع الحالي لهذا المقطع (قد يُستبدل أثناء التشغيل)
+            
+            # إذا كان المقطع صغيراً جداً، تجاهله
+            if len(audio_segment) < SAMPLE_RATE * 0.3:
+                continue
+            
+            dual = config.get("dual_output", False)
+            with stream_lock:
+                tail, tail_offset = streaming_tail(segment_utterance, audio_segment)
+                prefix = committed_text()
+                if dual:
+                    # الوضع المزدوج: العبارة كاملة حتى تغطي الترجمة نفس الصوت
+                    tail, tail_offset, prefix = audio_segment, 0, ""
+                if len(tail) < SAMPLE_RATE * MIN_TAIL_DURATION:
+                    if not is_final:
+                        continue
+                    # كل النص مثبت مسبقاً، لا حاجة لفك ترميز جديد
+                    tail = None
+                else:
+                    apply_prompt(transcribe_options, include_committed=not dual)
+            
+            seq = None
+            if tail is not None:
+                post_subtitle(("status", "Transcribing..."))
+                decode_options = apply_decode_policy(transcribe_options, is_final, len(tail))
+                decode_options = quality_controller.decode_options(decode_options)
+                worker_pool, seq = submit_to_pool(tail, decode_options, word_timestamps=not is_final, translate=dual)
+            # صوت العبارة كاملة للمقاطع النهائية فقط (للتحسين لاحقاً)
+            audio = audio_segment if is_final else None
+            pool_tickets.put((worker_pool, seq, is_final, segment_utterance, tail_offset, prefix, trace, audio))
+            
+        except Exception as e:
+            print(f"⚠ خطأ في توزيع النسخ: {e}")
+            time.sleep(0.1)
+
+# مهمة النشر: استلام النتائج بترتيب الإرسال وتطبيقها على حالة العبارة
+def pool_publish_task():
+    while True:
+        ticket = pool_tickets.get()
+        if ticket is None:
+            break  # أُوقف خط المعالجة
+        worker_pool, seq, is_final, segment_utterance, tail_offset, prefix, trace, audio = ticket
+        try:
+            result = worker_pool.result(seq) if seq is not None else None
+            if result is not None:
+                metrics.observe_result(result)
+                quality_controller.observe(result["audio_seconds"], result["encode_time"] + result["decode_time"],
+                                           processing_queue.last_wait)
+            
+            with stream_lock:
+                if is_final:
+                    # النص المثبت وقت الإرسال + نص الذيل
+                    text = result["text"].strip() if result else ""
+                    detected_text = (prefix + " " + text).strip()
+                    if stream_state["utterance_id"] == segment_utterance:
+                        reset_stream_state()
+                elif stream_state["utterance_id"] != segment_utterance:
+                    # نتيجة جزئية لعبارة انتهت بالفعل
+                    metrics.count("stale_partials")
+                    continue
+                else:
+                    tail_start = tail_offset / SAMPLE_RATE
+                    words = [(w, start + tail_start, end + tail_start) for w, start, end in result["words"]]
+                    detected_text = streaming_commit(words).strip()
+            
+            publish_text(detected_text, is_final, trace, result.get("translation") if result else None, audio)
+            
+        except Exception as e:
+            print(f"⚠ خطأ في النسخ: {e}")
+
+# ----- تحسين المقاطع النهائية في أوقات الصمت -----
+
+class RefinementInterrupted(Exception):
+    """وصل كلام جديد أثناء تحسين مقطع"""
+
+# مرشح رموز يوقف فك ترميز التحسين قبل الرمز التالي فور وصول كلام جديد
+class YieldOnSpeech:
+    def apply(self, logits, tokens):
+        if refinement_should_yield():
+            raise RefinementInterrupted()
+
+# النسخ المباشر له الأولوية: كلام جارٍ أو مقاطع تنتظر النسخ أو تُنسخ في عمليات المجمع
+# (خيط التوزيع يفرغ المجدول فوراً في وضع العمليات، فالقائمة وحدها لا تكفي)
+def refinement_should_yield():
+    if is_speaking or not processing_queue.empty() or not pool_tickets.empty():
+        return True
+    worker_pool = pool
+    return worker_pool is not None and worker_pool.busy()
+
+# إعادة فك ترميز مقطع نهائي بنموذج أكبر أو شعاع أوسع؛ تُرجع النص المحسن أو None
+def refine_segment(model, audio, translation):
+    options = build_transcribe_options()
+    options["beam_size"] = int(config.get("refine_beam_size", 5))
+    
+    with decode_lock:
+        # قد يطول انتظار القفل خلف النسخ المباشر، فيُعاد الفحص قبل ترميز الصوت
+        if refinement_should_yield():
+            raise RefinementInterrupted()
+        # الترميز بطول المقطع نفسه كالنسخ المباشر حتى لا يحجز المُرمِّز نافذة 30 ثانية كاملة
+        result = transcribe_segment(
+            model, audio, options,
+            translate=translation is not None,
+            logit_filters=(YieldOnSpeech(),)
+        )
+    
+    # نفس عتبة Whisper لرفض فك الترميز منخفض الثقة
+    if not result["text"].strip() or result["avg_logprob"] < -1.0:
+        return None
+    return result
+
+# خيط التحسين: يعمل فقط عندما يكون النسخ المباشر متوقفاً ويتخلى عن المقطع فور وصول كلام
+def refinement_task():
+    if not wait_for_model():
+        return
+    model = None
+    model_key = None
+    
+    while True:
+        refine_wakeup.wait()
+        if pipeline_stop.is_set():
+            break
+        if not refine_segments:
+            # المسح قبل إعادة الفحص حتى لا يضيع إيقاظ مقطع أُضيف بينهما
+            refine_wakeup.clear()
+            if not refine_segments:
+                continue
+        
+        # الانتظار حتى يكتمل الصمت، أو فترة كاملة إن كان النسخ المباشر مشغولاً
+        idle_in = REFINE_IDLE_DELAY - (clock() - last_speech_time)
+        busy = refinement_should_yield()
+        if busy or idle_in > 0:
+            pipeline_stop.wait(REFINE_IDLE_DELAY if busy else idle_in)
+            continue
+        
+        # يُعاد تحديد النموذج في كل دورة حتى يتبع تبديل النموذج من القائمة أو خفض الجودة
+        model_name = config.get("refine_model") or config["model_size"]
+        if model is not None and model_registry.key(model_name) != model_key:
+            model_registry.release(model)
+            model = None
+        
+        if model is None:
+            try:
+                model = model_registry.acquire(model_name)
+            except Exception as e:
+                print(f"⚠ تعذر تحميل نموذج التحسين {model_name}، تم إيقاف التحسين: {e}")
+                return
+            model_key = model_registry.key(model_name)
+        
+        segment = refine_segments.popleft()
+        segment_id, audio, text, translation = segment
+        try:
+            result = refine_segment(model, audio, translation)
+        except RefinementInterrupted:
+            # يعاد المقطع للقائمة ليُحسن في الصمت التالي
+            refine_segments.appendleft(segment)
+            metrics.count("refinements_interrupted")
+            continue
+        except Exception as e:
+            print(f"⚠ خطأ في التحسين: {e}")
+            continue
+        
+        metrics.count("refinements")
+        if result is None:
+            continue
+        refined = result["text"].strip()
+        refined_translation = result["translation"].strip() if translation is not None else None
+        if normalize_word(refined) == normalize_word(text) and refined_translation == translation:
+            continue
+        
+        # استبدال السطر السابق في الواجهة والنص المحفوظ والسياق
+        metrics.count("revisions")
+        print(f"✏ [REVISED]: {refined}")
+        if transcript is not None:
+            transcript.revise(segment_id, subtitle_text(refined, refined_translation))
+        with context_lock:
+            context_buffer[:] = [refined if line == text else line for line in context_buffer]
+        post_subtitle(("revise", segment_id, refined, refined_translation))
+    
+    if model is not None:
+        model_registry.release(model)
+
+# ----- المقاييس -----
+
+# جمع المقاييس مع أعماق القوائم وعدادات الإسقاط ومستوى الجودة
+def metrics_report():
+    report = metrics.snapshot()
+    scheduler = processing_queue.stats()
+    report["queues"] = {
+        "finals": scheduler["finals"],
+        "partials": scheduler["partials"],
+        "capture_samples": len(capture_buffer),
+        "subtitles": subtitle_queue.qsize()
+    }
+    report["counters"].update({key: scheduler[key] for key in processing_queue.counters})
+    report["counters"]["capture_dropped_samples"] = capture_dropped
+    report["quality"] = {
+        "level": QualityController.LEVELS[quality_controller.level],
+        "rtf": quality_controller.rtf,
+        "lag": quality_controller.lag
+    }
+    return report
+
+# سطر ملخص للسجل: المئينات بالمللي ثانية وRTF كنسبة
+def metrics_summary(report):
+    parts = []
+    for name in ("end_to_end", "queue", "preprocess", "encode", "decode", "render", "rtf"):
+        stage = report["stages"].get(name)
+        if stage is None:
+            continue
+        if name == "rtf":
+            parts.append(f"rtf {stage['p50']:.2f}/{stage['p95']:.2f}/{stage['p99']:.2f}")
+        else:
+            parts.append(f"{name} {stage['p50'] * 1000:.0f}/{stage['p95'] * 1000:.0f}/{stage['p99'] * 1000:.0f}ms")
+    
+    queues, counters = report["queues"], report["counters"]
+    parts.append(f"queues {queues['finals']}F/{queues['partials']}P")
+    parts.append(f"dropped {counters.get('dropped_deadline', 0)}+{counters.get('dropped_full', 0)}")
+    parts.append(f"quality {report['quality']['level']}")
+    parts.append("guards cap/rep/silence "
+                 f"{counters.get('guard_token_cap', 0)}/{counters.get('guard_repetition', 0)}/{counters.get('guard_no_speech', 0)}")
+    if counters.get("draft_proposed"):
+        # نسبة قبول المسودة ومتوسط الرموز المضافة لكل تمريرة تحقق للنموذج الهدف
+        rate = counters["draft_accepted"] / counters["draft_proposed"]
+        per_step = (counters["draft_accepted"] + counters["draft_steps"]) / counters["draft_steps"]
+        parts.append(f"draft {rate:.0%} accepted, {per_step:.1f} tok/step")
+    return "📊 p50/p95/p99 | " + " | ".join(parts)
+
+# طباعة ملخص المقاييس بشكل دوري
+def metrics_log_task(interval):
+    while not pipeline_stop.wait(interval):
+        try:
+            print(metrics_summary(metrics_report()))
+        except Exception as e:
+            print(f"⚠ خطأ في ملخص المقاييس: {e}")
+
+# خادم محلي يعرض المقاييس بصيغة JSON على /metrics
+def start_metrics_server(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(metrics_report(), ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # عدم إغراق السجل بكل طلب
+    
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📊 المقاييس متاحة على http://127.0.0.1:{port}/metrics")
+    return server
+
 # ----- واجهة المستخدم المحسنة -----
 
 # إنشاء نافذة اختيار المودل واللغة
@@ -862,8 +2936,6 @@ def show_fake_progress(progress_var, status_label, duration=20):
 
 # تحميل المودل وبدء التطبيق
 def download_and_continue(model_name, progress_var, status_label, root):
-    global MODEL
-    
     # تحديث واجهة المستخدم
     status_label.config(text=f"جاري تحميل نموذج {model_name}...")
     progress_var.set(0)
@@ -875,9 +2947,11 @@ def download_and_continue(model_name, progress_var, status_label, root):
         if success:
             # تحميل النموذج
             try:
-                global MODEL
-                MODEL = whisper.load_model(model_name, download_root=MODELS_DIR)
-                print(f"تم تحميل نموذج Whisper {model_name}")
+                # في وضع العمليات تحمّل كل عملية نموذجها، فلا تُحجز نسخة غير مستخدمة في العملية الرئيسية
+                if int(config.get("worker_processes", 0)) == 0:
+                    # التحميل عبر السجل: start_transcription سيستخدم النسخة نفسها دون تحميل جديد
+                    use_model(model_registry.acquire(model_name))
+                    print(f"تم تحميل نموذج Whisper {model_name}")
             except Exception as e:
                 print(f"خطأ أثناء تحميل النموذج: {e}")
                 if root.winfo_exists():
@@ -911,8 +2985,19 @@ def download_and_continue(model_name, progress_var, status_label, root):
     # بدء التحميل الحقيقي في خيط منفصل
     threading.Thread(target=real_download, daemon=True).start()
 
+# ارتفاع نافذة الترجمة: في الوضع المزدوج سطران إضافيان للترجمة (قد تلتف على سطرين) بارتفاع تقريبي 1.7 × حجم الخط
+def subtitle_window_height():
+    extra = 2 * int(config.get("font_size", 18) * 1.7) if config.get("dual_output", False) else 0
+    return 130 + extra
+
+# نص عنوان النافذة: اسم التطبيق واللغة الحالية
+def window_title_text():
+    lang_name = SUPPORTED_LANGUAGES.get(config["language"], config["language"].upper())
+    return f"{APP_NAME} ({lang_name})"
+
 # دالة إعداد واجهة الترجمة
 def setup_subtitles_ui():
+    global ui_title_label
     root = tk.Tk()
     root.title(APP_NAME)
     root.overrideredirect(True)  # إزالة شريط العنوان الافتراضي
@@ -926,7 +3011,7 @@ def setup_subtitles_ui():
     # ضبط حجم النافذة وموقعها
     screen = screeninfo.get_monitors()[0]
     window_width = 800
-    window_height = 130
+    window_height = subtitle_window_height()
     x = (screen.width - window_width) // 2
     y = screen.height - window_height - 100
     root.geometry(f"{window_width}x{window_height}+{x}+{y}")
@@ -940,15 +3025,15 @@ def setup_subtitles_ui():
     title_frame.pack(fill="x", pady=(0, 5))
     
     # عنوان التطبيق مع اللغة
-    lang_name = SUPPORTED_LANGUAGES.get(config["language"], config["language"].upper())
     title_label = Label(
         title_frame,
-        text=f"{APP_NAME} ({lang_name})",
+        text=window_title_text(),
         font=("Segoe UI", 10),
         fg=colors["text_secondary"],
         bg=colors["bg"]
     )
     title_label.pack(side="left")
+    ui_title_label = title_label
     
     # اسم المطور
     dev_label = Label(
@@ -1279,15 +3364,65 @@ def show_settings(parent_root):
         
         font_var.trace("w", update_font_label)
         
+        # قسم النسخ: يُطبق مباشرة دون إعادة تشغيل
+        create_section_title(main_frame, "إعدادات النسخ")
+        
+        transcription_frame = create_glass_frame(main_frame)
+        transcription_frame.pack(fill="x", pady=(0, 20))
+        
+        # اختيار النموذج
+        model_row = Frame(transcription_frame, bg=colors["card_bg"], pady=8)
+        model_row.pack(fill="x")
+        
+        Label(
+            model_row, 
+            text="النموذج:", 
+            font=("Segoe UI", 10),
+            fg=colors["text"], 
+            bg=colors["card_bg"]
+        ).pack(side="left")
+        
+        model_var = StringVar(value=config.get("model_size", "tiny"))
+        
+        model_options_frame = Frame(model_row, bg=colors["card_bg"])
+        model_options_frame.pack(side="right")
+        
+        for model_name, model_info in AVAILABLE_MODELS.items():
+            ttk.Radiobutton(
+                model_options_frame,
+                text=model_info.get("arabic_name", model_name),
+                variable=model_var,
+                value=model_name
+            ).pack(side="left", padx=5)
+        
+        # اختيار اللغة
+        lang_var = StringVar(value=config.get("language", DEFAULT_LANGUAGE))
+        
+        lang_grid_frame = Frame(transcription_frame, bg=colors["card_bg"], pady=8)
+        lang_grid_frame.pack(fill="x")
+        
+        for index, (lang_code, lang_name) in enumerate(SUPPORTED_LANGUAGES.items()):
+            ttk.Radiobutton(
+                lang_grid_frame,
+                text=f"{lang_name} ({lang_code})",
+                variable=lang_var,
+                value=lang_code
+            ).grid(row=index // 3, column=index % 3, sticky="w", padx=5, pady=3)
+        
         # إطار الأزرار
         buttons_frame = Frame(main_frame, bg=colors["bg"], pady=15)
         buttons_frame.pack(side="bottom", fill="x")
         
         # دالة حفظ الإعدادات
         def save_settings():
+            global settings_window_open, settings_window
             config["opacity"] = opacity_var.get()
             config["font_size"] = font_var.get()
             config["theme"] = theme_var.get()
+            # اللغة تُقرأ مع كل مقطع، والنموذج يُحمّل في الخلفية ثم يُبدّل
+            config["language"] = lang_var.get()
+            if model_var.get() != config.get("model_size"):
+                switch_model(model_var.get())
             save_config()
             settings_window.unbind_all("<MouseWheel>")
             settings_window.unbind_all("<Button-4>")
@@ -1379,6 +3514,16 @@ def apply_settings_to_main(root):
     # تحديث الشفافية
     root.attributes("-alpha", config["opacity"])
     
+    # اللغة قد تتغير أثناء التشغيل
+    if ui_title_label is not None:
+        ui_title_label.config(text=window_title_text())
+    
+    # ارتفاع الوضع المزدوج يتبع حجم الخط: تغيير الارتفاع مع إبقاء الحافة السفلية في مكانها
+    height = subtitle_window_height()
+    if height != root.winfo_height():
+        bottom = root.winfo_y() + root.winfo_height()
+        root.geometry(f"{root.winfo_width()}x{height}+{root.winfo_x()}+{bottom - height}")
+    
     # تحديث لون الخلفية
     root.configure(bg=colors["bg"])
     
@@ -1564,10 +3709,14 @@ def start_download(model_name, progress_var, status_label, start_button, window)
         # تفعيل زر البدء مرة أخرى للمحاولة مرة أخرى
         start_button.configure(state="normal")
 
-# تحديث واجهة المستخدم
+# تحديث واجهة المستخدم (يُستدعى عند حدث <<SubtitleUpdate>>)
 def update_ui(root, subtitle_label, status_label, status_indicator):
+    global displayed_segment
     colors = THEME[current_theme]
     
+    # مسح العلامة قبل التفريغ حتى لا يضيع إيقاظ يصل أثناءه
+    ui_wake_pending.clear()
+    
     while not subtitle_queue.empty():
         try:
             data = subtitle_queue.get_nowait()
@@ -1584,8 +3733,26 @@ def update_ui(root, subtitle_label, status_label, status_indicator):
                 else:
                     status_indicator.config(bg=colors["accent"])
                     
-            elif data[0] == "text":
+            elif data[0] == "error":
+                # فشل تحميل النموذج في الخلفية
+                status_label.config(text="Status: Error", fg=colors["error"])
+                status_indicator.config(bg=colors["error"])
+                messagebox.showerror(data[1], data[2], parent=root)
+                root.destroy()
+                return
+                
+            elif data[0] == "revise":
+                # تحسين مقطع سابق: يُستبدل فقط إذا كان لا يزال المعروض
+                if data[1] == displayed_segment:
+                    subtitle_label.config(text=subtitle_text(data[2], data[3]), fg=colors["text"])
+                
+            elif data[0] in ("text", "dual"):
                 text, is_final = data[1], data[2]
+                has_trace = len(data) > 3 and data[3] is not None
+                displayed_segment = data[3]["id"] if is_final and has_trace else None
+                if data[0] == "dual":
+                    # سطر بلغة المصدر وتحته الترجمة الإنجليزية
+                    text = subtitle_text(text, data[4])
                 
                 # تنسيق النص حسب نوعه (نهائي أو جزئي)
                 if is_final:
@@ -1596,43 +3763,150 @@ def update_ui(root, subtitle_label, status_label, status_indicator):
                 # تحديث حالة الاستماع
                 status_label.config(text="Status: Listening", fg=colors["success"])
                 status_indicator.config(bg=colors["success"])
+                
+                if len(data) > 3 and data[3] is not None:
+                    data[3]["render"] = clock()
+                    metrics.complete(data[3])
         except:
             pass
+
+# تحميل النموذج (أو تشغيل عمليات النسخ) وتسخينه قبل إعلان الجاهزية
+def prepare_model(model_name, timings):
+    global pool, model_error, DRAFT_MODEL
+    model_error = None
     
-    # جدولة التحديث القادم
-    root.after(50, lambda: update_ui(root, subtitle_label, status_label, status_indicator))
+    try:
+        start = time.perf_counter()
+        workers = int(config.get("worker_processes", 0))
+        if workers > 0:
+            # كل عملية تحمل نموذجها وتسخنه بنفسها
+            pool = TranscriptionPool(model_name, workers, int(config.get("worker_torch_threads", 0)))
+            pool.start()
+            error = pool.wait_ready()
+            if error:
+                raise RuntimeError(error)
+            timings["model"] = time.perf_counter() - start
+            print(f"تم تشغيل {workers} عملية نسخ للنموذج {model_name} على {get_device()}")
+        else:
+            use_model(model_registry.acquire(model_name))
+            timings["model"] = time.perf_counter() - start
+            print(f"تم تحميل نموذج Whisper {model_name} ({config.get('precision', 'fp32')}) على {get_device()}")
+            
+            start = time.perf_counter()
+            warm_up_model(MODEL)
+            timings["warmup"] = time.perf_counter() - start
+            
+            DRAFT_MODEL = load_draft_model(MODEL)
+        
+        timings["ready"] = time.perf_counter() - APP_START
+        model_ready.set()
+        post_subtitle(("status", "Listening..."))
+        log_startup_timings(timings)
+    except Exception as e:
+        model_error = str(e)
+        print(f"خطأ في تحميل النموذج: {e}")
+        post_subtitle(("error", "خطأ في التحميل", f"حدث خطأ أثناء تحميل نموذج {model_name}.\n{model_error}"))
+
+# تبديل النموذج أثناء التشغيل: يُحمّل الجديد في الخلفية والحالي يواصل النسخ حتى لحظة التبديل
+def switch_model(model_name, persist=True, on_done=None):
+    def load():
+        global pool
+        ok = False
+        with model_switch_lock:
+            try:
+                print(f"🔄 جاري تحميل النموذج {model_name} في الخلفية...")
+                post_subtitle(("status", f"Loading {model_name}..."))
+                
+                workers = int(config.get("worker_processes", 0))
+                if workers > 0:
+                    new_pool = TranscriptionPool(model_name, workers, int(config.get("worker_torch_threads", 0)))
+                    new_pool.start()
+                    error = new_pool.wait_ready()
+                    if error:
+                        new_pool.stop()
+                        raise RuntimeError(error)
+                    # المقاطع المرسلة للمجمع القديم تكتمل فيه ثم يُغلق
+                    previous, pool = pool, new_pool
+                    if previous is not None:
+                        threading.Thread(target=previous.close, daemon=True).start()
+                else:
+                    model = model_registry.acquire(model_name)
+                    warm_up_model(model)
+                    # يُقرأ MODEL مرة واحدة لكل مقطع، فالتبديل يقع بين مقطعين
+                    use_model(model)
+                
+                if persist:
+                    config["model_size"] = model_name
+                    save_config()
+                print(f"✅ تم التبديل إلى النموذج {model_name}")
+                ok = True
+            except Exception as e:
+                print(f"⚠ تعذر التبديل إلى النموذج {model_name}: {e}")
+            finally:
+                post_subtitle(("status", "Listening..."))
+        if on_done:
+            on_done(ok)
+    
+    threading.Thread(target=load, daemon=True).start()
+
+# أكبر نموذج منزّل أصغر من النموذج المختار في الإعدادات (None إذا لم يوجد)
+# حتى لا يبدأ خفض الجودة تنزيلاً في منتصف الجلسة
+def smaller_model_name():
+    names = list(AVAILABLE_MODELS)
+    index = names.index(config["model_size"]) if config.get("model_size") in names else 0
+    return next((name for name in reversed(names[:index]) if check_model_downloaded(name)), None)
+
+# تسجيل لحظة ظهور النافذة منذ بدء العملية
+def record_window_shown(timings):
+    timings["window"] = time.perf_counter() - APP_START
+    target = "✅" if timings["window"] < 1.0 else "⚠"
+    print(f"{target} ظهرت النافذة بعد {timings['window']:.2f} ثانية")
+    if model_ready.is_set():
+        log_startup_timings(timings)
+
+# طباعة تفصيل زمن بدء التشغيل (مرة واحدة بعد ظهور النافذة وجاهزية النموذج)
+def log_startup_timings(timings):
+    if "window" not in timings or "ready" not in timings or timings.get("logged"):
+        return
+    timings["logged"] = True
+    parts = [f"{name}: {timings[name]:.2f}s" for name in
+             ("config", "devices", "ui", "window", "model", "warmup", "ready") if name in timings]
+    print("⏱ زمن بدء التشغيل | " + " | ".join(parts))
 
 # وظيفة بدء النسخ الرئيسية
 def start_transcription():
-    global MODEL, vad, config, current_theme
+    global vad, config, current_theme, ui_root, pool, transcript
+    timings = {}
     
     # تحميل الإعدادات
     config = load_config()
     current_theme = config.get("theme", "dark")
+    timings["config"] = time.perf_counter() - APP_START
     
-    # تحميل المودل
-    try:
-        MODEL = whisper.load_model(config["model_size"], download_root=MODELS_DIR)
-        print(f"تم تحميل نموذج Whisper {config['model_size']} على {DEVICE}")
-    except Exception as e:
-        print(f"خطأ في تحميل النموذج: {e}")
-        messagebox.showerror("خطأ في التحميل", f"حدث خطأ أثناء تحميل نموذج {config['model_size']}.\n{str(e)}")
-        create_model_selector()
-        return
+    # حالة نظيفة (قائمة مقاطع جديدة ومسح pipeline_stop) إذا كان هذا تشغيلاً بعد محاولة فاشلة
+    reset_pipeline_state()
+    
+    # تحميل المودل وتسخينه في الخلفية بالتوازي مع اكتشاف الجهاز وبناء الواجهة
+    model_ready.clear()
+    threading.Thread(target=prepare_model, args=(config["model_size"], timings), daemon=True).start()
     
     # إعداد WebRTC VAD
     vad = webrtcvad.Vad()
     vad.set_mode(2)  # استخدام وضع متوسط بدلاً من الوضع الأكثر تشدداً
     
     # البحث عن جهاز الصوت
+    start = time.perf_counter()
     device_id = get_system_audio_device()
+    timings["devices"] = time.perf_counter() - start
     if device_id is None:
         print("لم يتم العثور على جهاز صوت مناسب. يرجى التحقق من إعدادات الصوت.")
         messagebox.showerror("خطأ في جهاز الصوت", "لم يتم العثور على جهاز صوت مناسب.\nيرجى التحقق من إعدادات الصوت وأن الجهاز متصل بشكل صحيح.")
         return
     
     # إعداد واجهة المستخدم
+    start = time.perf_counter()
     root, subtitle_label, status_label, status_indicator = setup_subtitles_ui()
+    timings["ui"] = time.perf_counter() - start
     
     # الحصول على كائن subtitle_canvas
     subtitle_canvas = None
@@ -1646,11 +3920,39 @@ def start_transcription():
                             break
     
     print(f"جاري بدء العمل... (اضغط 'q' للخروج، 's' لإخفاء/إظهار الترجمة، 'o' للإعدادات)")
-    print(f"النموذج: {config['model_size']}, اللغة: {config['language']}, الجهاز: {DEVICE}")
+    print(f"النموذج: {config['model_size']}, اللغة: {config['language']}")
+    if not model_ready.is_set():
+        post_subtitle(("status", "Loading model..."))
+    
+    # بدء مهمة النسخ في مؤشر ترابط منفصل (تنتظر جاهزية النموذج)
+    pool_mode = int(config.get("worker_processes", 0)) > 0
+    if pool_mode:
+        threads = [threading.Thread(target=pool_dispatch_task, daemon=True),
+                   threading.Thread(target=pool_publish_task, daemon=True)]
+    else:
+        threads = [threading.Thread(target=transcribe_task, daemon=True)]
+    
+    # النص المحفوظ وتحسين المقاطع النهائية في أوقات الصمت
+    if config.get("transcript_file"):
+        transcript = Transcript(config["transcript_file"])
+        print(f"📄 حفظ النص في: {config['transcript_file']}")
+    if config.get("refinement", False):
+        threads.append(threading.Thread(target=refinement_task, daemon=True))
+    
+    # المقاييس: خادم محلي وملخص دوري في السجل
+    metrics_server = None
+    if int(config.get("metrics_port", 0)) > 0:
+        try:
+            metrics_server = start_metrics_server(int(config["metrics_port"]))
+        except OSError as e:
+            print(f"⚠ تعذر تشغيل خادم المقاييس: {e}")
+    if float(config.get("metrics_interval", 0)) > 0:
+        threads.append(threading.Thread(target=metrics_log_task, args=(float(config["metrics_interval"]),), daemon=True))
     
-    # بدء مهمة النسخ في مؤشر ترابط منفصل
-    transcription_thread = threading.Thread(target=transcribe_task, daemon=True)
-    transcription_thread.start()
+    # خيط التقطيع الذي يستهلك مخزن الالتقاط
+    threads.append(threading.Thread(target=segmenter_task, daemon=True))
+    for thread in threads:
+        thread.start()
     
     # بدء تدفق الصوت
     stream = sd.InputStream(
@@ -1667,8 +3969,11 @@ def start_transcription():
         # بدء التدفق
         stream.start()
         
-        # إظهار النافذة وبدء التحديث
-        root.after(50, lambda: update_ui(root, subtitle_label, status_label, status_indicator))
+        # تحديث الواجهة عند وصول بيانات جديدة فقط، وتفريغ ما وصل قبل الربط
+        root.bind("<<SubtitleUpdate>>", lambda event: update_ui(root, subtitle_label, status_label, status_indicator))
+        ui_root = root
+        root.after_idle(lambda: update_ui(root, subtitle_label, status_label, status_indicator))
+        root.after_idle(lambda: record_window_shown(timings))
         
         # إلغاء تسجيل الاختصارات السابقة إن وجدت
         keyboard.unhook_all()
@@ -1689,7 +3994,22 @@ def start_transcription():
     except Exception as e:
         print(f"خطأ: {e}")
     finally:
-        # تنظيف
+        # تنظيف: إيقاف خيوط هذا التشغيل قبل أي تشغيل جديد
+        # (مستهلك واحد فقط لمخزن الالتقاط ولحالة العبارة)
+        ui_root = None
+        pipeline_stop.set()
+        capture_event.set()
+        refine_wakeup.set()
+        processing_queue.close()
+        if pool_mode:
+            pool_tickets.put(None)
+        for thread in threads:
+            thread.join(timeout=2)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if pool is not None:
+            pool.stop()
+            pool = None
         if 'stream' in locals():
             stream.stop()
             stream.close()
@@ -1703,6 +4023,40 @@ def start_transcription():
         # حفظ إعدادات الجهاز
         config["last_device_id"] = device_id
         save_config()
+    
+    # فشل تحميل النموذج في الخلفية: العودة لاختيار النموذج
+    if model_error is not None:
+        create_model_selector()
+
+# ----- إعادة ضبط خط المعالجة -----
+
+# إعادة الحالة العامة لخط المعالجة قبل كل ملف أو تشغيل
+def reset_pipeline_state():
+    global processing_queue, metrics, capture_dropped, speech_written_until, next_partial_at
+    global stream_position, highpass_sos, highpass_state, running_peak, silence_counter, is_speaking
+    global last_speech_time, last_segment_time, utterance_id
+    
+    processing_queue = SegmentScheduler()
+    metrics = Metrics()
+    capture_buffer.clear()
+    speech_buffer.clear()
+    while not subtitle_queue.empty():
+        subtitle_queue.get_nowait()
+    while not pool_tickets.empty():
+        pool_tickets.get_nowait()
+    capture_dropped = 0
+    speech_written_until = next_partial_at = stream_position = 0
+    highpass_sos = highpass_state = None
+    running_peak = PEAK_FLOOR
+    silence_counter = 0
+    is_speaking = False
+    last_speech_time = last_segment_time = clock()
+    with context_lock:
+        context_buffer.clear()
+    utterance_id = 0
+    reset_stream_state()
+    pipeline_stop.clear()
+    capture_event.clear()
 
 # الدالة الرئيسية
 def main():
@@ -1869,4 +4223,6 @@ def create_section_title(parent, text):
     return title_frame
 
 if __name__ == "__main__":
+    # ضروري لعمليات النسخ في الملف التنفيذي المجمّد على Windows
+    multiprocessing.freeze_support()
     main()
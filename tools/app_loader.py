@@ -0,0 +1,17 @@
+# تحميل سكربت التطبيق كوحدة لأدوات التطوير (اسم الملف فيه مسافة فلا يمكن استيراده مباشرة)
+import importlib.util
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Live Subtitles.py")
+MODULE_NAME = "live_subtitles"
+
+# الوحدة تُسجل في sys.modules حتى تجد عمليات المجمع (spawn) دوالها عند فك التسلسل
+def load_app():
+    if MODULE_NAME in sys.modules:
+        return sys.modules[MODULE_NAME]
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = app
+    spec.loader.exec_module(app)
+    return app
@@ -0,0 +1,196 @@
+# القياسات الدقيقة للدوال الساخنة (تعمل 33+ مرة في الثانية) مع خط أساس JSON وبوابة تراجع
+# الاستخدام: python tools/bench.py --bench-save baseline.json ثم python tools/bench.py --bench-compare baseline.json
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import webrtcvad
+
+from app_loader import load_app
+
+app = load_app()
+
+BENCH_ROUNDS = 40  # عدد عينات كل قياس دقيق (يُقارن أصغرها)
+BENCH_MIN_SAMPLE_NS = 10_000_000  # أقل زمن للعينة الواحدة حتى لا تطغى دقة الساعة والجدولة (10ms)
+BENCH_NOISE_FACTOR = 2  # توسيع العتبة = هذا المعامل × تشتت القياسين، بحد أقصى ضعف العتبة
+
+# عنصر واجهة بديل لقياس حلقة تفريغ update_ui دون شاشة
+class BenchWidget:
+    def config(self, **kwargs):
+        pass
+
+# صوت اصطناعي ثابت (كلام مُحاكى بتوافقيات + ضجيج) حتى تكون النتائج قابلة للمقارنة
+def bench_fixture(seconds=2.0):
+    rng = np.random.default_rng(1234)
+    t = np.arange(int(app.SAMPLE_RATE * seconds)) / app.SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(120 + 20 * np.sin(2 * np.pi * 0.5 * t)) / app.SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 20)) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    audio = 0.3 * voiced / np.abs(voiced).max() + 0.005 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+# قياس مجموعة دوال: لكل منها أصغر زمن لكل وحدة (نانوثانية) عبر عدة عينات وتشتته النسبي، وذروة الذاكرة المؤقتة لكل استدعاء
+# cases: الاسم -> (الدالة، العناصر، دالة إعادة الحالة أو None، الوحدة)
+def bench_run(cases, rounds=BENCH_ROUNDS):
+    def sample(fn, items, reset, number):
+        # التهيئة بعد reset (مثل حساب معاملات الفلتر) خارج الزمن حتى لا يتغير وزنها مع عدد التكرارات
+        if reset:
+            reset()
+            fn(items[0])
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            for item in items:
+                fn(item)
+        return time.perf_counter_ns() - start
+    
+    numbers = {}
+    samples = {name: [] for name in cases}
+    gc.disable()  # كما يفعل timeit: لا يُحسب جامع المهملات في الزمن
+    try:
+        for name, (fn, items, reset, _) in cases.items():
+            fn(items[0])  # تسخين
+            # مضاعفة عدد التكرارات حتى تبلغ العينة 10ms على الأقل (كما يفعل timeit.autorange)
+            numbers[name] = 1
+            while sample(fn, items, reset, numbers[name]) < BENCH_MIN_SAMPLE_NS:
+                numbers[name] *= 2
+        # العينات متداخلة بين القياسات حتى تتوزع فترات بطء الجهاز عليها كلها بالتساوي
+        for _ in range(rounds):
+            for name, (fn, items, reset, _) in cases.items():
+                samples[name].append(sample(fn, items, reset, numbers[name]) / (numbers[name] * len(items)))
+    finally:
+        gc.enable()
+    
+    results = {}
+    half = rounds // 2
+    for name, (fn, items, reset, unit) in cases.items():
+        # الضجيج يضيف زمناً فقط، فالأصغر أثبت من الوسيط؛ وتشتته = الفرق بين أصغر نصفي العينات
+        best = min(samples[name])
+        spread = abs(min(samples[name][:half]) - min(samples[name][half:])) / best if best else 0.0
+        
+        # الذاكرة المؤقتة لاستدعاء في الحالة المستقرة (بعد التهيئة التي يقوم بها reset)
+        if reset:
+            reset()
+        fn(items[0])
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn(items[len(items) // 2])
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+        results[name] = {"ns": best, "spread": spread, "alloc_bytes": max(peak, 0), "unit": unit}
+    return results
+
+# تشغيل القياسات الدقيقة: detect_speech_frames، process_audio، butter_highpass، audio_callback وتفريغ update_ui
+def run_benchmarks():
+    vad = webrtcvad.Vad()
+    vad.set_mode(2)
+    audio = bench_fixture()
+    blocks = [audio[i:i + app.BLOCK_SIZE] for i in range(0, len(audio) - app.BLOCK_SIZE + 1, app.BLOCK_SIZE)]
+    
+    def reset_filter():
+        app.highpass_sos = app.highpass_state = None
+        app.running_peak = app.PEAK_FLOOR
+    
+    def callback(block):
+        # تفريغ المخزن عند امتلائه حتى لا يُقاس مسار الإسقاط
+        if app.capture_buffer.free() < app.BLOCK_SIZE:
+            app.capture_buffer.clear()
+        app.audio_callback(block, app.BLOCK_SIZE, None, None)
+    
+    messages = [("text", f"caption {i}", i % 4 == 0, None) for i in range(50)]
+    widget = BenchWidget()
+    
+    def drain(batch):
+        for message in batch:
+            app.subtitle_queue.put(message)
+        app.update_ui(None, widget, widget, widget)
+    
+    results = bench_run({
+        "detect_speech_frames": (lambda block: app.detect_speech_frames(block, vad), [audio[:app.SAMPLE_RATE // 2]], None,
+                                 "block"),
+        "process_audio": (app.process_audio, blocks, reset_filter, "block"),
+        "butter_highpass": (lambda _: app.butter_highpass(app.HIGHPASS_CUTOFF), range(200), None, "call"),
+        "audio_callback": (callback, [block.reshape(-1, 1) for block in blocks], app.capture_buffer.clear, "block"),
+        "update_ui_drain": (drain, [messages] * 100, None, "50 messages")
+    })
+    app.capture_buffer.clear()
+    reset_filter()
+    return results
+
+# التراجع المسموح لقياس: العتبة موسعة بتشتت التشغيلين بحد أقصى ضعفها؛
+# تُرجع أيضاً هل التشتت أكبر من أن يُحكم على الفرق (نتيجة غير حاسمة)
+def bench_tolerance(result, reference, threshold):
+    noise = BENCH_NOISE_FACTOR * (result.get("spread", 0.0) + reference.get("spread", 0.0))
+    return min(max(threshold, noise), 2 * threshold), noise > 2 * threshold
+
+# طباعة نتائج القياسات مع المقارنة بخط الأساس إن وجد؛ تُرجع أسماء القياسات المتراجعة وغير الحاسمة
+def print_benchmarks(results, baseline=None, threshold=0.05):
+    regressions, inconclusive = [], []
+    print(f"\n{'benchmark':<22}{'ns/unit':>12}{'±':>7}{'alloc B':>10}{'baseline':>12}{'ratio':>8}{'limit':>8}  unit")
+    for name, result in results.items():
+        reference = (baseline or {}).get(name)
+        ratio, limit, status = "", "", ""
+        if reference:
+            ratio_value = result["ns"] / reference["ns"]
+            tolerance, noisy = bench_tolerance(result, reference, threshold)
+            ratio, limit = f"{ratio_value:.2f}", f"{1 + tolerance:.2f}"
+            # هامش ثابت صغير للذاكرة حتى لا تُحسب فروق المُخصِّص تراجعاً
+            if result["alloc_bytes"] > reference["alloc_bytes"] * (1 + threshold) + 256:
+                regressions.append(name)
+                status = " ⚠"
+            elif ratio_value > 1 + tolerance:
+                # تجاوز الحد مع تشتت عالٍ لا يُقبل ولا يُحسب تراجعاً مؤكداً
+                (inconclusive if noisy else regressions).append(name)
+                status = " ?" if noisy else " ⚠"
+        reference_ns = f"{reference['ns']:.0f}" if reference else "-"
+        spread = f"{result['spread']:.1%}"
+        print(f"{name:<22}{result['ns']:>12.0f}{spread:>7}{result['alloc_bytes']:>10}{reference_ns:>12}{ratio:>8}{limit:>8}"
+              f"  {result['unit']}{status}")
+    return regressions, inconclusive
+
+# حفظ نتائج القياسات كخط أساس JSON
+def save_benchmarks(results, path):
+    data = {"python": sys.version.split()[0], "numpy": np.__version__, "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"✅ تم حفظ خط الأساس في: {path}")
+
+# مقارنة القياسات بخط أساس محفوظ؛ تُرجع رمز الخروج: 0 بلا تراجع، 1 تراجع، 2 نتيجة غير حاسمة لضجيج القياس
+def compare_benchmarks(path, threshold=0.05):
+    with open(path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    
+    regressions, inconclusive = print_benchmarks(run_benchmarks(), baseline, threshold)
+    if regressions:
+        print(f"❌ تراجع الأداء بأكثر من الحد المسموح: {', '.join(regressions)}")
+        return 1
+    if inconclusive:
+        print(f"⚠ نتائج غير حاسمة (تشتت القياس أكبر من العتبة)، أعد التشغيل على جهاز أهدأ: {', '.join(inconclusive)}")
+        return 2
+    print(f"✅ لا يوجد تراجع يتجاوز {threshold:.0%}")
+    return 0
+
+# قراءة خيارات سطر الأوامر
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"{app.APP_NAME} - القياسات الدقيقة")
+    parser.add_argument("--bench-save", metavar="JSON", help="حفظ نتائج القياسات الدقيقة كخط أساس")
+    parser.add_argument("--bench-compare", metavar="JSON",
+                        help="مقارنة القياسات الدقيقة بخط أساس والفشل عند تجاوز العتبة")
+    parser.add_argument("--bench-threshold", type=float, default=0.05,
+                        help="أقصى تراجع مسموح نسبة إلى خط الأساس (0.05 = 5%%)؛ يُوسَّع حسب تشتت القياس حتى ضعفها")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.bench_compare:
+        sys.exit(compare_benchmarks(args.bench_compare, args.bench_threshold))
+    results = run_benchmarks()
+    print_benchmarks(results)
+    if args.bench_save:
+        save_benchmarks(results, args.bench_save)
+
+if __name__ == "__main__":
+    main()
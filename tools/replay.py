@@ -0,0 +1,303 @@
+# أدوات التطوير لخط المعالجة: إعادة تشغيل ملفات WAV دون بطاقة صوت، ومقارنة مسارات المُرمِّز وتقرير التكميم
+# الاستخدام: python tools/replay.py --replay clip.wav [--backend stand-in --replay-speed 5]
+import argparse
+import os
+import queue
+import threading
+import time
+import wave
+
+import numpy as np
+import webrtcvad
+from scipy.signal import resample_poly
+
+from app_loader import load_app
+
+# يُحمّل على مستوى الوحدة حتى تجده عمليات المجمع التي تعيد تنفيذ هذا السكربت
+app = load_app()
+
+# ----- أدوات القياس والمقارنة -----
+
+# قراءة ملف WAV وتحويله إلى عينات float32 أحادية بتردد SAMPLE_RATE
+def load_wav(path):
+    with wave.open(path, "rb") as wav:
+        sample_width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    
+    if sample_width == 2:
+        audio = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+    elif sample_width == 4:
+        audio = np.frombuffer(raw, dtype=np.int32).astype(np.float32) / 2147483648.0
+    elif sample_width == 1:
+        audio = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"عرض عينة غير مدعوم: {sample_width}")
+    
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != app.SAMPLE_RATE:
+        divisor = np.gcd(rate, app.SAMPLE_RATE)
+        audio = resample_poly(audio, app.SAMPLE_RATE // divisor, rate // divisor)
+    
+    return audio.astype(np.float32)
+
+# قراءة النص المرجعي المرافق لملف الصوت (نفس الاسم بامتداد .txt)
+def load_reference(wav_path):
+    txt_path = os.path.splitext(wav_path)[0] + ".txt"
+    if not os.path.exists(txt_path):
+        return None
+    with open(txt_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+# نسبة خطأ الكلمات (WER) بمسافة Levenshtein على مستوى الكلمات
+def word_error_rate(reference, hypothesis):
+    ref = [app.normalize_word(w) for w in reference.split() if app.normalize_word(w)]
+    hyp = [app.normalize_word(w) for w in hypothesis.split() if app.normalize_word(w)]
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        previous, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (r != h))
+    return row[-1] / len(ref)
+
+# قياس زمن الترميز وفك الترميز ونسبة الخطأ لنموذج على مجموعة مقاطع
+def measure_clips(model, clips, options, min_seconds=None):
+    # تسخين النموذج حتى لا يحسب وقت التهيئة في القياس
+    app.transcribe_segment(model, clips[0][1], options, min_seconds=min_seconds)
+    
+    encode_times, decode_times, errors = [], [], []
+    for path, audio, reference in clips:
+        result = app.transcribe_segment(model, audio, options, min_seconds=min_seconds)
+        encode_times.append(result["encode_time"] * 1000)
+        decode_times.append(result["decode_time"] * 1000)
+        if reference is not None:
+            errors.append(word_error_rate(reference, result["text"]))
+    
+    return np.mean(encode_times), np.mean(decode_times), (np.mean(errors) if errors else None)
+
+# طباعة سطر من جدول المقارنة
+def print_measure_row(name, encode_ms, decode_ms, wer):
+    wer = f"{wer:.3f}" if wer is not None else "-"
+    print(f"{name:<16}{encode_ms:>12.1f}{decode_ms:>12.1f}{encode_ms + decode_ms:>12.1f}{wer:>8}")
+
+# مقارنة الدقة وزمن الاستجابة بين المسار المبطن (30 ثانية) ومسار الطول المتغير
+def compare_encoder_paths(wav_paths, model_name):
+    model = app.load_whisper_model(model_name)
+    options = app.build_transcribe_options()
+    clips = [(path, load_wav(path), load_reference(path)) for path in wav_paths]
+    
+    print(f"\nالنموذج: {model_name} | المقاطع: {len(clips)}")
+    print(f"{'path':<16}{'encode ms':>12}{'decode ms':>12}{'total ms':>12}{'WER':>8}")
+    print_measure_row("padded", *measure_clips(model, clips, options, app.whisper.audio.CHUNK_LENGTH))
+    print_measure_row("variable", *measure_clips(model, clips, options, float(app.config.get("encoder_min_seconds", 3.0))))
+
+# تقرير الدقة وزمن الاستجابة للتكميم int8 مقارنة بـ fp32 لكل حجم نموذج
+def quantization_report(wav_paths, model_names):
+    options = app.build_transcribe_options()
+    options["fp16"] = False
+    clips = [(path, load_wav(path), load_reference(path)) for path in wav_paths]
+    
+    print(f"\nتقرير التكميم | المقاطع: {len(clips)}")
+    print(f"{'model':<16}{'encode ms':>12}{'decode ms':>12}{'total ms':>12}{'WER':>8}")
+    for model_name in model_names:
+        for precision in ("fp32", "int8"):
+            start = time.perf_counter()
+            model = app.load_whisper_model(model_name, precision)
+            load_time = time.perf_counter() - start
+            print_measure_row(f"{model_name}/{precision}", *measure_clips(model, clips, options))
+            print(f"{'':<16}load: {load_time:.2f}s")
+            del model
+
+# ----- إعادة التشغيل دون اتصال -----
+
+# ساعة افتراضية تتقدم بسرعة speed مقارنة بالوقت الحقيقي
+class ReplayClock:
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._origin = time.time()
+        self._start = time.perf_counter()
+    
+    def __call__(self):
+        return self._origin + (time.perf_counter() - self._start) * self.speed
+
+# نموذج بديل لاختبار خط المعالجة دون استدلال: يستهلك rtf × مدة الصوت من الزمن الافتراضي
+class StandInModel:
+    def __init__(self, rtf=0.3, speed=1.0, word_seconds=0.4):
+        self.rtf = rtf
+        self.speed = speed
+        self.word_seconds = word_seconds
+
+# بديل transcribe_segment للنموذج البديل: كلمة ثابتة لكل word_seconds من الصوت
+def stand_in_transcribe_segment(model, audio, options, word_timestamps=False, min_seconds=None, translate=False, draft=None,
+                                logit_filters=()):
+    duration = len(audio) / app.SAMPLE_RATE
+    cost = model.rtf * duration
+    time.sleep(cost / model.speed)
+    
+    count = int(duration / model.word_seconds)
+    words = [(" word", i * model.word_seconds, (i + 1) * model.word_seconds) for i in range(count)]
+    return {
+        "text": "".join(w[0] for w in words),
+        "translation": "".join(w[0] for w in words) if translate else None,
+        "words": words if word_timestamps else [],
+        "no_speech_prob": 0.0,
+        "avg_logprob": 0.0,
+        "audio_seconds": duration,
+        "preprocess_time": 0.0,
+        "encode_time": cost / 2,
+        "decode_time": cost / 2
+    }
+
+# بديل transcribe_batch للنموذج البديل
+def stand_in_transcribe_batch(model, audios, options, translate=False):
+    return [stand_in_transcribe_segment(model, audio, options, translate=translate) for audio in audios]
+
+# تشغيل ملف WAV عبر audio_callback وخيطي التقطيع والنسخ الحقيقيين
+def replay_file(path, speed):
+    audio = load_wav(path)
+    app.reset_pipeline_state()
+    
+    finals, final_latency, partial_latency = [], [], []
+    rendering = threading.Event()
+    rendering.set()
+    
+    # بديل update_ui دون واجهة: تسجيل لحظة "العرض" لكل نص
+    def render_task():
+        while rendering.is_set() or not app.subtitle_queue.empty():
+            try:
+                data = app.subtitle_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if data[0] not in ("text", "dual") or data[3] is None:
+                continue
+            data[3]["render"] = app.clock()
+            app.metrics.complete(data[3])
+            latency = data[3]["render"] - data[3]["capture"]
+            if data[2]:
+                finals.append(data[1])
+                final_latency.append(latency)
+            else:
+                partial_latency.append(latency)
+    
+    threads = [threading.Thread(target=target, daemon=True)
+               for target in (app.segmenter_task, app.transcribe_task, render_task)]
+    for thread in threads:
+        thread.start()
+    
+    # صمت في النهاية حتى يُغلق آخر مقطع
+    trailing = np.zeros(int(app.SAMPLE_RATE * (app.SILENCE_THRESHOLD + 0.5)), dtype=np.float32)
+    samples = np.concatenate((audio, trailing))
+    
+    # تغذية الكتل بإيقاع البطاقة الصوتية (مسرّعاً بمقدار speed)
+    block_size = app.BLOCK_SIZE
+    start = time.perf_counter()
+    for offset in range(0, len(samples) - block_size + 1, block_size):
+        block = samples[offset:offset + block_size].reshape(-1, 1)
+        app.audio_callback(block, block_size, None, None)
+        delay = start + (offset + block_size) / app.SAMPLE_RATE / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    
+    # تفريغ خط المعالجة بالترتيب: التقطيع، ثم النسخ، ثم العرض
+    while len(app.capture_buffer) and threads[0].is_alive():
+        time.sleep(0.01)
+    app.pipeline_stop.set()
+    app.capture_event.set()
+    threads[0].join()
+    app.processing_queue.close()
+    threads[1].join()
+    rendering.clear()
+    threads[2].join()
+    
+    report = app.metrics.snapshot()
+    reference = load_reference(path)
+    counters = app.processing_queue.counters
+    return {
+        "file": os.path.basename(path),
+        "audio_seconds": len(audio) / app.SAMPLE_RATE,
+        "finals": len(finals),
+        "final_latency": final_latency,
+        "partial_latency": partial_latency,
+        "rtf": report["counters"].get("processing_seconds", 0.0) / (len(audio) / app.SAMPLE_RATE),
+        "dropped": counters["dropped_deadline"] + counters["dropped_full"],
+        "capture_dropped": app.capture_dropped,
+        "text": " ".join(finals),
+        "wer": word_error_rate(reference, " ".join(finals)) if reference is not None else None
+    }
+
+# تقرير إعادة التشغيل: زمن ظهور الترجمة، RTF، المقاطع المسقطة وWER
+def replay_report(wav_paths, model_name, speed=1.0, backend="whisper", stand_in_rtf=0.3):
+    config = app.load_config()
+    config["adaptive_quality"] = False  # تبديل النموذج أثناء القياس يفسد المقارنة
+    config["metrics_port"] = 0
+    app.clock = ReplayClock(speed)
+    app.vad = webrtcvad.Vad()
+    app.vad.set_mode(2)
+    
+    if backend == "stand-in":
+        app.MODEL = StandInModel(stand_in_rtf, speed)
+        app.DEVICE = "cpu"  # النموذج البديل لا يحتاج torch
+        app.transcribe_segment = stand_in_transcribe_segment
+        app.transcribe_batch = stand_in_transcribe_batch
+    else:
+        app.MODEL = app.load_whisper_model(model_name)
+        app.warm_up_model(app.MODEL)
+    app.model_ready.set()
+    
+    def percentiles(values):
+        if not values:
+            return "-"
+        p50, p95 = np.percentile(values, [50, 95]) * 1000
+        return f"{p50:.0f}/{p95:.0f}"
+    
+    print(f"\nإعادة التشغيل | النموذج: {model_name if backend == 'whisper' else backend} | السرعة: x{speed}")
+    print(f"{'file':<24}{'audio s':>9}{'finals':>8}{'final ms':>12}{'partial ms':>12}{'RTF':>7}{'drops':>7}{'WER':>8}")
+    results = []
+    for path in wav_paths:
+        result = replay_file(path, speed)
+        results.append(result)
+        wer = f"{result['wer']:.3f}" if result["wer"] is not None and backend == "whisper" else "-"
+        drops = result["dropped"] + (1 if result["capture_dropped"] else 0)
+        print(f"{result['file'][:23]:<24}{result['audio_seconds']:>9.1f}{result['finals']:>8}"
+              f"{percentiles(result['final_latency']):>12}{percentiles(result['partial_latency']):>12}"
+              f"{result['rtf']:>7.2f}{drops:>7}{wer:>8}")
+    return results
+
+# قراءة خيارات سطر الأوامر
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"{app.APP_NAME} - أدوات خط المعالجة")
+    parser.add_argument("--compare-encoder", nargs="+", metavar="WAV",
+                        help="مقارنة المسار المبطن ومسار الطول المتغير على ملفات WAV")
+    parser.add_argument("--quant-report", nargs="+", metavar="WAV",
+                        help="تقرير الدقة وزمن الاستجابة لتكميم int8 لكل حجم نموذج")
+    parser.add_argument("--replay", nargs="+", metavar="WAV",
+                        help="تشغيل ملفات WAV عبر خط المعالجة كاملاً دون بطاقة صوت")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="سرعة التغذية (1 = الزمن الحقيقي؛ أكبر = المعالجة تبدو أبطأ بالنسبة نفسها)")
+    parser.add_argument("--backend", choices=("whisper", "stand-in"), default="whisper",
+                        help="نموذج حقيقي أو بديل بزمن ثابت لاختبار خط المعالجة")
+    parser.add_argument("--stand-in-rtf", type=float, default=0.3,
+                        help="زمن معالجة النموذج البديل نسبة إلى مدة الصوت")
+    parser.add_argument("--model", default=None, help="اسم النموذج المستخدم في أدوات القياس")
+    return parser, parser.parse_args()
+
+def main():
+    parser, args = parse_args()
+    if args.compare_encoder:
+        compare_encoder_paths(args.compare_encoder, args.model or app.load_config()["model_size"])
+    elif args.quant_report:
+        app.load_config()
+        quantization_report(args.quant_report, [args.model] if args.model else list(app.AVAILABLE_MODELS))
+    elif args.replay:
+        replay_report(args.replay, args.model or app.load_config()["model_size"], args.replay_speed,
+                      args.backend, args.stand_in_rtf)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()